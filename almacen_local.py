@@ -0,0 +1,252 @@
+# REDCOES - Almacenamiento local de datos descargados
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+import pandas as pd
+from cache_ttl import UnVuelo
+from metricas import medir, registrar_cache
+from planificador import planificador, INTERVALOS, INTERVALO_POR_DEFECTO
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos
+    fcntl = None
+
+DIRECTORIO_DATOS = os.getenv("REDCOES_DATA_DIR", ".redcoes_datos")
+RUTA_BD = os.path.join(DIRECTORIO_DATOS, "redcoes.sqlite3")
+DIRECTORIO_SNAPSHOTS = os.path.join(DIRECTORIO_DATOS, "snapshots")
+# Varios procesos de Streamlit en el mismo equipo comparten descargas a través de
+# los snapshots y de las cachés en SQLite de REDCOES_DATA_DIR
+COMPARTIR_PROCESOS = os.getenv("REDCOES_COMPARTIR_PROCESOS", "0") == "1"
+
+logger = logging.getLogger(__name__)
+
+
+def conectar():
+    os.makedirs(DIRECTORIO_DATOS, exist_ok=True)
+    conexion = sqlite3.connect(RUTA_BD, timeout=30)
+    # WAL permite leer mientras otra sesión escribe
+    conexion.execute("PRAGMA journal_mode=WAL")
+    return conexion
+
+
+def existe_tabla(conexion, tabla):
+    fila = conexion.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (tabla,)
+    ).fetchone()
+    return fila is not None
+
+
+def columnas_tabla(conexion, tabla):
+    return [fila[1] for fila in conexion.execute(f'PRAGMA table_info("{tabla}")')]
+
+
+# SNAPSHOTS EN DISCO
+
+def _ruta_snapshot(nombre):
+    return os.path.join(DIRECTORIO_SNAPSHOTS, f"{nombre}.parquet")
+
+
+def guardar_snapshot(nombre, df):
+    os.makedirs(DIRECTORIO_SNAPSHOTS, exist_ok=True)
+    ruta = _ruta_snapshot(nombre)
+    temporal = f"{ruta}.{threading.get_ident()}.tmp"
+    try:
+        df.to_parquet(temporal, index=False)
+    except Exception:
+        # Columnas con tipos mezclados o anidados (listas, dicts) se guardan como texto
+        texto = df.copy()
+        for col in texto.select_dtypes(include="object").columns:
+            texto[col] = texto[col].map(lambda v: v if v is None or isinstance(v, str) else str(v))
+        texto.to_parquet(temporal, index=False)
+    # El reemplazo es atómico: nunca se lee un archivo a medio escribir
+    os.replace(temporal, ruta)
+
+
+def cargar_snapshot(nombre):
+    # Devuelve (df, marca_tiempo) o None si no hay snapshot
+    ruta = _ruta_snapshot(nombre)
+    try:
+        return pd.read_parquet(ruta), os.path.getmtime(ruta)
+    except FileNotFoundError:
+        return None
+    except Exception:
+        logger.exception("Snapshot '%s' no legible", nombre)
+        return None
+
+
+def _mtime_snapshot(nombre):
+    try:
+        return os.path.getmtime(_ruta_snapshot(nombre))
+    except OSError:
+        return None
+
+
+@contextmanager
+def _bloqueo_entre_procesos(nombre):
+    # Solo un proceso descarga cada dataset a la vez; los demás esperan su snapshot
+    if not COMPARTIR_PROCESOS or fcntl is None:
+        yield
+        return
+    os.makedirs(DIRECTORIO_SNAPSHOTS, exist_ok=True)
+    with open(os.path.join(DIRECTORIO_SNAPSHOTS, f"{nombre}.lock"), "a") as archivo:
+        fcntl.flock(archivo, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(archivo, fcntl.LOCK_UN)
+
+
+# CACHÉ CLAVE-VALOR EN SQLITE (COMPARTIDA ENTRE PROCESOS)
+
+class CacheSQLite:
+    # Segundo nivel detrás de una CacheTTL en memoria para valores JSON con
+    # vencimiento. ttl en segundos; 0 significa que no vencen.
+    def __init__(self, tabla, ttl):
+        self.tabla = tabla
+        self.ttl = ttl
+        self._local = threading.local()
+
+    def _conexion(self):
+        conexion = getattr(self._local, "conexion", None)
+        if conexion is None:
+            conexion = self._local.conexion = conectar()
+            conexion.execute(
+                f'CREATE TABLE IF NOT EXISTS "{self.tabla}" (clave TEXT PRIMARY KEY, valor TEXT, expira REAL)'
+            )
+        return conexion
+
+    def obtener(self, clave):
+        fila = self._conexion().execute(
+            f'SELECT valor FROM "{self.tabla}" WHERE clave = ? AND (expira IS NULL OR expira > ?)',
+            (str(clave), time.time())
+        ).fetchone()
+        return json.loads(fila[0]) if fila else None
+
+    def guardar(self, clave, valor):
+        expira = time.time() + self.ttl if self.ttl else None
+        conexion = self._conexion()
+        with conexion:
+            conexion.execute(
+                f'INSERT OR REPLACE INTO "{self.tabla}" (clave, valor, expira) VALUES (?, ?, ?)',
+                (str(clave), json.dumps(valor), expira)
+            )
+
+    def borrar(self, clave):
+        conexion = self._conexion()
+        with conexion:
+            conexion.execute(f'DELETE FROM "{self.tabla}" WHERE clave = ?', (str(clave),))
+
+
+# ARRANQUE EN CALIENTE Y ACTUALIZACIÓN
+# Los datos servidos se guardan en memoria del proceso. Si no los hay, se sirve
+# el último snapshot en disco. El planificador descarga la versión nueva en
+# segundo plano y la reemplaza de una sola vez; mientras tanto nadie espera.
+
+_servidos = {}  # nombre -> (df, marca_tiempo)
+_snapshots_vistos = {}  # nombre -> mtime del snapshot que corresponde a lo servido
+_vuelos = UnVuelo()
+_lock = threading.Lock()
+
+
+def _servir(nombre, df, marca):
+    with _lock:
+        _servidos[nombre] = (df, marca)
+    planificador.marcar_actualizado(nombre, marca)
+    return df, marca
+
+
+def registrar(nombre, df):
+    resultado = _servir(nombre, df, time.time())
+    try:
+        guardar_snapshot(nombre, df)
+        _snapshots_vistos[nombre] = _mtime_snapshot(nombre)
+    except Exception:
+        logger.exception("No se pudo guardar el snapshot '%s'", nombre)
+    return resultado
+
+
+def _snapshot_de_otro_proceso(nombre, solo_vigente=False):
+    # Snapshot escrito por otro proceso después del que se está sirviendo aquí.
+    # Con solo_vigente, además debe estar dentro del intervalo de actualización.
+    mtime = _mtime_snapshot(nombre)
+    if mtime is None or mtime == _snapshots_vistos.get(nombre):
+        return None
+    if solo_vigente and time.time() - mtime >= INTERVALOS.get(nombre, INTERVALO_POR_DEFECTO):
+        return None
+    with medir(f"leer_snapshot:{nombre}"):
+        guardado = cargar_snapshot(nombre)
+    if guardado is not None:
+        _snapshots_vistos[nombre] = guardado[1]
+    return guardado
+
+
+def actualizar(nombre, cargar):
+    # Descarga y registra un dataset. Las llamadas simultáneas (sesiones, el
+    # planificador) comparten una sola descarga; con COMPARTIR_PROCESOS también
+    # entre procesos: si otro acaba de descargarlo se usa su snapshot.
+    def descargar():
+        with _bloqueo_entre_procesos(nombre):
+            if COMPARTIR_PROCESOS:
+                reciente = _snapshot_de_otro_proceso(nombre, solo_vigente=True)
+                if reciente is not None:
+                    return _servir(nombre, *reciente)
+            return registrar(nombre, cargar())
+    return _vuelos.ejecutar(nombre, descargar)
+
+
+def _programar(nombre, cargar, marca):
+    planificador.programar(nombre, lambda: actualizar(nombre, cargar), ultima=marca)
+
+
+def obtener_guardado(nombre, cargar):
+    # Datos en memoria o, en su defecto, el snapshot en disco. Devuelve None si no
+    # hay nada guardado. En ambos casos queda programada la actualización periódica.
+    with _lock:
+        servido = _servidos.get(nombre)
+    registrar_cache(nombre, servido is not None)
+    if servido is not None and COMPARTIR_PROCESOS:
+        # Otro proceso pudo haber actualizado el dataset desde la última lectura
+        reciente = _snapshot_de_otro_proceso(nombre)
+        if reciente is not None:
+            servido = _servir(nombre, *reciente)
+    if servido is None:
+        with medir(f"leer_snapshot:{nombre}"):
+            servido = cargar_snapshot(nombre)
+        if servido is None:
+            return None
+        with _lock:
+            if nombre not in _servidos:
+                _snapshots_vistos[nombre] = servido[1]
+            servido = _servidos.setdefault(nombre, servido)
+    _programar(nombre, cargar, servido[1])
+    return servido
+
+
+def ultimo_guardado(nombre):
+    # Lo que se está sirviendo o, si no hay, el último snapshot; sin programar
+    # actualizaciones (lo usan los propios cargadores)
+    with _lock:
+        servido = _servidos.get(nombre)
+    return servido if servido is not None else cargar_snapshot(nombre)
+
+
+def cargar_con_snapshot(nombre, cargar):
+    guardado = obtener_guardado(nombre, cargar)
+    if guardado is not None:
+        return guardado
+    # Sin datos previos (primer arranque): única carga en primer plano, compartida
+    # por todas las sesiones que lleguen mientras tanto
+    with medir(f"carga_inicial:{nombre}"):
+        resultado = actualizar(nombre, cargar)
+    _programar(nombre, cargar, resultado[1])
+    return resultado
+
+
+def solicitar_actualizacion(*nombres):
+    planificador.solicitar(*nombres)
@@ -0,0 +1,192 @@
+# REDCOES - Datos sintéticos para las pruebas de rendimiento
+# Mismas formas que devuelven Moodle y los endpoints /redcoes/v1 de WordPress.
+
+import numpy as np
+import pandas as pd
+
+# Tamaños por escala; "grande" es la escala objetivo (10k cursos, 100k usuarios, 1M pedidos)
+ESCALAS = {
+    "pequena": {"cursos": 200, "usuarios": 2_000, "pedidos": 20_000, "productos": 60, "miembros": 2_000, "matriculas": 25},
+    "mediana": {"cursos": 2_000, "usuarios": 20_000, "pedidos": 200_000, "productos": 300, "miembros": 10_000, "matriculas": 30},
+    "grande": {"cursos": 10_000, "usuarios": 100_000, "pedidos": 1_000_000, "productos": 1_500, "miembros": 50_000, "matriculas": 40},
+}
+
+SEMILLA = 20240101
+# Fracción de ids de usuario sin usuario (cuentas eliminadas): genera huecos como en producción
+FRACCION_ELIMINADOS = 0.03
+AÑOS_HISTORIA = 4
+
+NOMBRES = ["Ana", "José", "María", "Luis", "Carmen", "Jorge", "Sofía", "Carlos", "Lucía", "Miguel", "Elena", "Óscar"]
+APELLIDOS = ["López", "Martínez", "Hernández", "García", "Rodríguez", "Pérez", "Sánchez", "Ramírez", "Flores", "Cruz"]
+CIUDADES = ["San Salvador", "Santa Ana", "San Miguel", "Soyapango", "Santa Tecla", "Mejicanos"]
+TEMAS = ["NIIF para PYMES", "Auditoría", "Tributación", "Contabilidad de costos", "Ética profesional",
+         "Finanzas", "Control interno", "Lavado de dinero", "Excel financiero", "Sector público"]
+MODALIDADES = ["Virtual", "Presencial"]
+AFILIACIONES = ["Miembro", "No miembro"]
+ESTADOS_PEDIDO = ["completed", "processing", "on-hold", "cancelled", "refunded"]
+PESOS_ESTADO_PEDIDO = [0.8, 0.08, 0.04, 0.05, 0.03]
+ESTADOS_PRODUCTO = ["publish", "draft", "private"]
+
+
+class DatosSinteticos:
+    # Todo se genera de forma determinista a partir de la semilla; las matrículas
+    # de cada curso se calculan al pedirlas para no guardar millones de filas.
+    def __init__(self, escala="pequena", semilla=SEMILLA):
+        self.tamanos = ESCALAS[escala]
+        self.semilla = semilla
+        rng = np.random.default_rng(semilla)
+        self.ahora = pd.Timestamp.now().floor("s")
+        self.inicio_historia = self.ahora - pd.DateOffset(years=AÑOS_HISTORIA)
+
+        self.productos = self._generar_productos(rng)
+        self.usuarios = self._generar_usuarios(rng)
+        self.ids_usuarios = np.array(sorted(self.usuarios), dtype=np.int64)
+        self.cursos = self._generar_cursos(rng)
+        self.pedidos = self._generar_pedidos(rng)
+        self.miembros = self._generar_miembros(rng)
+        self.matriculas_extra = {}  # course_id -> set(user_id) agregados con enrol_manual_enrol_users
+
+    # MOODLE
+
+    def _generar_cursos(self, rng):
+        n = self.tamanos["cursos"]
+        segundos_historia = int((self.ahora - self.inicio_historia).total_seconds())
+        # Desde hace AÑOS_HISTORIA hasta seis meses en el futuro
+        inicios = int(self.inicio_historia.timestamp()) + rng.integers(0, segundos_historia + 183 * 86400, n)
+        duraciones = rng.integers(7, 180, n) * 86400
+        temas = rng.integers(0, len(TEMAS), n)
+        cursos = [{
+            "id": 1, "shortname": "REDCOES", "fullname": "Aula Virtual REDCOES", "categoryid": 0,
+            "format": "site", "startdate": 0, "enddate": 0, "visible": 1,
+        }]
+        for i in range(n):
+            course_id = i + 2
+            cursos.append({
+                "id": course_id,
+                "shortname": f"C{course_id}",
+                "fullname": f"{TEMAS[temas[i]]} - Grupo {course_id}",
+                "categoryid": int(temas[i]) + 1,
+                "format": "topics",
+                "startdate": int(inicios[i]),
+                "enddate": int(inicios[i] + duraciones[i]),
+                "visible": 1,
+            })
+        return cursos
+
+    def _generar_usuarios(self, rng):
+        n = self.tamanos["usuarios"]
+        total_ids = int(n / (1 - FRACCION_ELIMINADOS))
+        ids = np.sort(rng.choice(np.arange(2, total_ids + 2), size=n, replace=False))
+        nombres = rng.integers(0, len(NOMBRES), n)
+        apellidos = rng.integers(0, len(APELLIDOS), (n, 2))
+        ciudades = rng.integers(0, len(CIUDADES), n)
+        acreditados = rng.random(n) < 0.6
+        usuarios = {}
+        for i, uid in enumerate(ids.tolist()):
+            nombre = NOMBRES[nombres[i]]
+            apellido = f"{APELLIDOS[apellidos[i, 0]]} {APELLIDOS[apellidos[i, 1]]}"
+            usuario = {
+                "id": uid,
+                "username": f"usuario{uid}",
+                "firstname": nombre,
+                "lastname": apellido,
+                "fullname": f"{nombre} {apellido}",
+                "email": f"usuario{uid}@correo.example",
+                "city": CIUDADES[ciudades[i]],
+                "country": "SV",
+            }
+            if acreditados[i]:
+                # El número a veces viene con HTML del editor de Moodle, como en producción
+                numero = str(1000 + uid)
+                usuario["customfields"] = [
+                    {"type": "text", "shortname": "nombrescvpcpa", "name": "Nombres", "value": nombre},
+                    {"type": "text", "shortname": "apellidoscvpcpa", "name": "Apellidos", "value": apellido},
+                    {"type": "menu", "shortname": "tipoinscripcion", "name": "Tipo", "value": "Persona natural"},
+                    {"type": "textarea", "shortname": "numero", "name": "Número",
+                     "value": f"<p>{numero}</p>" if uid % 3 == 0 else numero},
+                ]
+            usuarios[uid] = usuario
+        return usuarios
+
+    def participantes(self, course_id):
+        # Usuarios matriculados en un curso; siempre los mismos para el mismo curso
+        ids = []
+        if 2 <= course_id < self.tamanos["cursos"] + 2:
+            rng = np.random.default_rng(self.semilla + course_id)
+            cantidad = min(int(rng.poisson(self.tamanos["matriculas"])), len(self.ids_usuarios))
+            ids = rng.choice(self.ids_usuarios, size=cantidad, replace=False).tolist()
+        # Las agregadas con enrol_manual_enrol_users (las únicas de los cursos creados después)
+        ids += sorted(self.matriculas_extra.get(course_id, set()) - set(ids))
+        return [self.usuarios[uid] for uid in ids if uid in self.usuarios]
+
+    def matricular(self, course_id, user_id):
+        self.matriculas_extra.setdefault(course_id, set()).add(user_id)
+
+    def crear_curso(self, fullname, shortname, categoryid):
+        course_id = max(curso["id"] for curso in self.cursos) + 1
+        inicio = int(self.ahora.timestamp())
+        self.cursos.append({
+            "id": course_id, "shortname": shortname, "fullname": fullname, "categoryid": int(categoryid),
+            "format": "topics", "startdate": inicio, "enddate": inicio + 30 * 86400, "visible": 1,
+        })
+        return course_id
+
+    # WORDPRESS
+
+    def _generar_productos(self, rng):
+        n = self.tamanos["productos"]
+        filas = []
+        for i in range(n):
+            # Cada producto tiene variaciones por modalidad y afiliación
+            nombre = f"{TEMAS[i % len(TEMAS)]} {2020 + i // len(TEMAS) % 6} - Edición {i + 1}"
+            estado = ESTADOS_PRODUCTO[0] if rng.random() < 0.85 else ESTADOS_PRODUCTO[int(rng.integers(1, 3))]
+            for modalidad in MODALIDADES:
+                for afiliacion in AFILIACIONES:
+                    precio = float(rng.integers(20, 300)) * (0.8 if afiliacion == "Miembro" else 1.0)
+                    filas.append({
+                        "id": len(filas) + 1,
+                        "nombre": nombre,
+                        "precio_regular": round(precio, 2),
+                        "estado": estado,
+                        "modalidad": modalidad,
+                        "tipo_afiliacion": afiliacion,
+                    })
+        return pd.DataFrame(filas)
+
+    def _generar_pedidos(self, rng):
+        n = self.tamanos["pedidos"]
+        segundos_historia = int((self.ahora - self.inicio_historia).total_seconds())
+        # Más pedidos recientes que antiguos
+        desfases = (segundos_historia * (1 - rng.power(2.0, n))).astype(np.int64)
+        fechas = self.ahora - pd.to_timedelta(np.sort(desfases)[::-1], unit="s")
+        variaciones = self.productos.iloc[rng.integers(0, len(self.productos), n)].reset_index(drop=True)
+        clientes = rng.choice(self.ids_usuarios, size=n)
+        return pd.DataFrame({
+            "id": np.arange(1, n + 1),
+            "total": variaciones["precio_regular"].to_numpy(),
+            "fecha_pedido": fechas.strftime("%Y-%m-%d %H:%M:%S"),
+            "producto": variaciones["nombre"].to_numpy(),
+            "modalidad": variaciones["modalidad"].to_numpy(),
+            "tipo_de_afiliacion": variaciones["tipo_afiliacion"].to_numpy(),
+            "estado": rng.choice(ESTADOS_PEDIDO, size=n, p=PESOS_ESTADO_PEDIDO),
+            "nombre": [self.usuarios[uid]["fullname"] for uid in clientes.tolist()],
+            "email": [self.usuarios[uid]["email"] for uid in clientes.tolist()],
+        })
+
+    def _generar_miembros(self, rng):
+        n = self.tamanos["miembros"]
+        segundos_historia = int((self.ahora - self.inicio_historia).total_seconds())
+        inicios = self.inicio_historia + pd.to_timedelta(rng.integers(0, segundos_historia, n), unit="s")
+        emails = rng.choice(self.ids_usuarios, size=n, replace=n > len(self.ids_usuarios))
+        return pd.DataFrame({
+            "email": [self.usuarios[uid]["email"] for uid in emails.tolist()],
+            "subscription_starts": inicios.strftime("%Y-%m-%d %H:%M:%S"),
+            # Como los envía WordPress: id del nivel de membresía en texto
+            "membership_level": rng.choice(["2", "4"], size=n, p=[0.7, 0.3]),
+            "account_state": rng.choice(["active", "inactive", "pending"], size=n, p=[0.8, 0.15, 0.05]),
+        })
+
+    def pedidos_desde(self, desde=None):
+        if not desde:
+            return self.pedidos
+        return self.pedidos[self.pedidos["fecha_pedido"] >= desde]
@@ -0,0 +1,228 @@
+# REDCOES - Pruebas de rendimiento contra el servidor simulado
+#
+# Mide la carga en frío, la primera vista de cada sección, los reruns en caliente,
+# los cambios de sección, curso y filtro y las exportaciones ejecutando
+# dashboard_combinado.py con el AppTest de Streamlit (sin navegador). Cada ejecución es un arranque en frío nuevo del proceso.
+# También mide los trabajos de matrículas masivas y clonación de cursos.
+#
+#   python -m bench.ejecutar --escala mediana --latencia 0.05 --repeticiones 5 --json resultados.json
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from bench.datos_sinteticos import ESCALAS
+from bench.servidor_simulado import TOKEN, CLAVE
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(RAIZ, "dashboard_combinado.py")
+DATASETS = ["cursos", "usuarios", "participantes", "pedidos", "productos", "miembros"]
+
+
+def iniciar_servidor(args):
+    comando = [
+        sys.executable, "-m", "bench.servidor_simulado", "--escala", args.escala,
+        "--latencia", str(args.latencia), "--variacion", str(args.variacion),
+    ]
+    if args.ancho_banda:
+        comando += ["--ancho-banda", str(args.ancho_banda)]
+    # En otro proceso para que el servidor no compita por el GIL con el dashboard
+    proceso = subprocess.Popen(comando, cwd=RAIZ, stdout=subprocess.PIPE, text=True)
+    linea = proceso.stdout.readline()
+    if not linea:
+        proceso.wait()
+        raise RuntimeError("El servidor simulado no arrancó")
+    return proceso, json.loads(linea)
+
+
+def configurar_entorno(urls, directorio_datos):
+    # Debe hacerse antes de importar los módulos del dashboard: leen el entorno al importarse
+    os.environ.update(urls)
+    os.environ["MOODLE_TOKEN"] = TOKEN
+    os.environ["REDCOES_DATA_DIR"] = directorio_datos
+    # Sin actualizaciones en segundo plano durante la medición
+    for nombre in DATASETS:
+        os.environ[f"REDCOES_INTERVALO_{nombre.upper()}"] = "86400"
+
+
+class Resultados:
+    def __init__(self):
+        self.escenarios = {}
+
+    @contextmanager
+    def medir(self, escenario):
+        antes = _trafico()
+        inicio = time.perf_counter()
+        yield
+        segundos = time.perf_counter() - inicio
+        despues = _trafico()
+        datos = self.escenarios.setdefault(escenario, {"segundos": [], "peticiones": [], "bytes": []})
+        datos["segundos"].append(segundos)
+        datos["peticiones"].append(despues[0] - antes[0])
+        datos["bytes"].append(despues[1] - antes[1])
+
+    def imprimir(self):
+        print(f"\n{'escenario':<34} {'n':>3} {'mediana s':>10} {'mín s':>8} {'máx s':>8} {'peticiones':>11} {'MB':>8}")
+        for escenario, datos in self.escenarios.items():
+            tiempos = datos["segundos"]
+            print(
+                f"{escenario:<34} {len(tiempos):>3} {statistics.median(tiempos):>10.3f} {min(tiempos):>8.3f} "
+                f"{max(tiempos):>8.3f} {statistics.median(datos['peticiones']):>11.0f} "
+                f"{statistics.median(datos['bytes']) / 1e6:>8.2f}"
+            )
+
+
+def _trafico():
+    # (peticiones, bytes) acumulados hacia Moodle y WordPress según metricas
+    import metricas
+    peticiones = bytes_ = 0
+    for (tipo, _), valores in metricas.totales().items():
+        if tipo in ("moodle", "wordpress"):
+            peticiones += valores["llamadas"]
+            bytes_ += valores["bytes"]
+    return peticiones, bytes_
+
+
+def _comprobar(app):
+    if app.exception:
+        raise RuntimeError(f"El dashboard lanzó una excepción: {app.exception[0].message}")
+    errores = [error.value for error in app.error]
+    if errores:
+        raise RuntimeError("El dashboard mostró errores: " + " | ".join(str(e) for e in errores))
+
+
+def _ejecutar(app, resultados, escenario):
+    with resultados.medir(escenario):
+        app.run()
+    _comprobar(app)
+
+
+def _recorrer_secciones(app, resultados, clave, escenario):
+    # La primera sección ya se mostró; cada una de las demás se calcula al verla
+    for seccion in app.radio(key=clave).options[1:]:
+        app.radio(key=clave).set_value(seccion)
+        _ejecutar(app, resultados, escenario)
+
+
+def escenarios_dashboard(args, resultados):
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(APP, default_timeout=args.timeout)
+    app.run()
+    _comprobar(app)
+
+    # Moodle es el módulo por defecto tras ingresar la clave
+    app.text_input(key="clave_ingresada").input(CLAVE)
+    _ejecutar(app, resultados, "moodle: carga en frío")
+    _recorrer_secciones(app, resultados, "seccion_moodle", "moodle: primera vista de sección")
+    for _ in range(args.repeticiones):
+        _ejecutar(app, resultados, "moodle: rerun en caliente")
+    app.radio(key="seccion_moodle").set_value("📚 Participantes de cursos")
+    _ejecutar(app, resultados, "moodle: cambio de sección")
+    for i in range(args.repeticiones):
+        selector = next(s for s in app.selectbox if s.label == "Selecciona un curso")
+        selector.set_value(selector.options[(i + 1) % len(selector.options)])
+        _ejecutar(app, resultados, "moodle: cambio de curso")
+
+    app.sidebar.radio[0].set_value("WordPress")
+    _ejecutar(app, resultados, "wordpress: carga en frío")
+    _recorrer_secciones(app, resultados, "seccion_wordpress", "wordpress: primera vista de sección")
+    for _ in range(args.repeticiones):
+        _ejecutar(app, resultados, "wordpress: rerun en caliente")
+    app.radio(key="seccion_wordpress").set_value("📊 Pedidos")
+    _ejecutar(app, resultados, "wordpress: cambio de sección")
+    valores = [["completed"], ["completed", "processing"]]
+    for i in range(args.repeticiones):
+        estado = next(m for m in app.multiselect if m.label == "Estado:" and "completed" in m.options)
+        estado.set_value(valores[(i + 1) % len(valores)])
+        _ejecutar(app, resultados, "wordpress: cambio de filtro")
+
+
+def escenarios_exportacion(args, resultados):
+    from almacen_local import cargar_snapshot
+    from cubo_pedidos import filtrar
+    from exportacion import FORMATOS, exportar
+
+    guardado = cargar_snapshot("pedidos")
+    if guardado is None:
+        raise RuntimeError("No hay snapshot de pedidos: la carga de WordPress no terminó")
+    pedidos = filtrar(guardado[0], {"estado": ["completed"]})
+    for formato in FORMATOS:
+        for _ in range(args.repeticiones):
+            with resultados.medir(f"exportar {formato} ({len(pedidos)} filas)"):
+                exportar(pedidos, formato, "Pedidos")
+
+
+def escenarios_trabajos(args, resultados):
+    import pandas as pd
+    import trabajos_moodle
+
+    # Correos de ids consecutivos: los de usuarios eliminados quedan como no encontrados
+    tamanos = ESCALAS[args.escala]
+    usuarios = [2 + i % tamanos["usuarios"] for i in range(args.matriculas)]
+    filas = pd.DataFrame({
+        "email": [f"usuario{uid}@correo.example" for uid in usuarios],
+        "course_id": [2 + i % tamanos["cursos"] for i in range(args.matriculas)],
+    })
+    for i in range(args.repeticiones):
+        trabajo_id = trabajos_moodle.crear_trabajo_matriculas(trabajos_moodle.leer_matriculas(filas)[0])
+        with resultados.medir(f"trabajo: {args.matriculas} matrículas"):
+            trabajos_moodle.ejecutar(trabajo_id)
+        _comprobar_trabajo(trabajo_id)
+
+        clonadas = trabajos_moodle.leer_matriculas(filas[["email"]], con_curso=False)[0]
+        trabajo_id = trabajos_moodle.crear_trabajo_clonacion(2, f"Bench {i}", f"BENCH-{os.getpid()}-{i}", 1, clonadas)
+        with resultados.medir(f"trabajo: clonar y matricular {len(clonadas)}"):
+            trabajos_moodle.ejecutar(trabajo_id)
+        _comprobar_trabajo(trabajo_id)
+
+
+def _comprobar_trabajo(trabajo_id):
+    import trabajos_moodle
+    avance = trabajos_moodle.progreso(trabajo_id)
+    if avance["estado"] != "completado":
+        raise RuntimeError(f"El trabajo {trabajo_id} terminó en estado {avance['estado']}: {avance['error']}")
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Pruebas de rendimiento del dashboard REDCOES")
+    parser.add_argument("--escala", choices=list(ESCALAS), default="pequena")
+    parser.add_argument("--latencia", type=float, default=0.05, help="segundos añadidos a cada respuesta")
+    parser.add_argument("--variacion", type=float, default=0.0, help="segundos aleatorios extra por respuesta")
+    parser.add_argument("--ancho-banda", type=float, default=None, help="bytes por segundo simulados")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--matriculas", type=int, default=2000, help="filas del CSV de los trabajos de matrícula")
+    parser.add_argument("--timeout", type=float, default=900, help="segundos máximos por rerun")
+    parser.add_argument("--datos", default=None,
+                        help="carpeta REDCOES_DATA_DIR; reutilizarla mide el arranque con snapshots")
+    parser.add_argument("--json", default=None, help="guardar los resultados en este archivo")
+    args = parser.parse_args(argumentos)
+
+    sys.path.insert(0, RAIZ)
+    servidor, urls = iniciar_servidor(args)
+    temporal = tempfile.TemporaryDirectory(prefix="redcoes_bench_") if args.datos is None else None
+    try:
+        configurar_entorno(urls, args.datos or temporal.name)
+        resultados = Resultados()
+        escenarios_dashboard(args, resultados)
+        escenarios_exportacion(args, resultados)
+        escenarios_trabajos(args, resultados)
+    finally:
+        servidor.terminate()
+        servidor.wait()
+        if temporal is not None:
+            temporal.cleanup()
+
+    resultados.imprimir()
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as archivo:
+            json.dump({"parametros": vars(args), "escenarios": resultados.escenarios}, archivo, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
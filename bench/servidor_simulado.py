@@ -0,0 +1,289 @@
+# REDCOES - Servidor local que imita la API REST de Moodle y los endpoints /redcoes/v1
+#
+# Uso independiente (por ejemplo para abrir el dashboard contra datos sintéticos):
+#   python -m bench.servidor_simulado --escala mediana --latencia 0.08 --puerto 8765
+#   MOODLE_URL=http://127.0.0.1:8765/webservice/rest/server.php MOODLE_TOKEN=token-bench \
+#   REDCOES_WP_URL=http://127.0.0.1:8765/wp-json/redcoes/v1 streamlit run dashboard_combinado.py
+
+import argparse
+import gzip
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from bench.datos_sinteticos import DatosSinteticos, ESCALAS
+
+TOKEN = "token-bench"
+CLAVE = "clave-bench"
+RUTA_MOODLE = "/webservice/rest/server.php"
+PREFIJO_WP = "/wp-json/redcoes/v1/"
+# Respuestas más chicas que esto no se comprimen (como hace Apache con mod_deflate)
+MINIMO_GZIP = 1024
+MINIMO_GZIP_CACHE = 1024 * 1024
+
+
+def _lista_indexada(params, nombre):
+    # {"values[0]": "5", "values[1]": "7"} -> ["5", "7"];
+    # {"options[0][name]": "a", "options[0][value]": "b"} -> [{"name": "a", "value": "b"}]
+    elementos = {}
+    for clave, valor in params.items():
+        if not clave.startswith(f"{nombre}["):
+            continue
+        partes = clave[len(nombre):].strip("[]").split("][")
+        indice = int(partes[0])
+        if len(partes) == 1:
+            elementos[indice] = valor
+        else:
+            elementos.setdefault(indice, {})[partes[1]] = valor
+    return [elementos[i] for i in sorted(elementos)]
+
+
+def _error_moodle(errorcode, mensaje, excepcion="moodle_exception"):
+    return {"exception": excepcion, "errorcode": errorcode, "message": mensaje}
+
+
+class ApiSimulada:
+    def __init__(self, datos, token=TOKEN, clave=CLAVE):
+        self.datos = datos
+        self.token = token
+        self.clave = clave
+        self._lock = threading.Lock()
+        self._respuestas = {}  # respuestas completas ya serializadas (cursos, pedidos, ...)
+        self._comprimidas = {}  # cuerpo -> cuerpo comprimido con gzip
+        self.peticiones = 0
+
+    def _serializada(self, clave, construir):
+        with self._lock:
+            if clave not in self._respuestas:
+                self._respuestas[clave] = construir()
+            return self._respuestas[clave]
+
+    def comprimir(self, cuerpo):
+        # Las respuestas grandes (cursos, pedidos...) se repiten: se comprimen una sola vez
+        if len(cuerpo) < MINIMO_GZIP_CACHE:
+            return gzip.compress(cuerpo, compresslevel=5)
+        with self._lock:
+            comprimido = self._comprimidas.get(cuerpo)
+        if comprimido is None:
+            comprimido = gzip.compress(cuerpo, compresslevel=5)
+            with self._lock:
+                self._comprimidas[cuerpo] = comprimido
+        return comprimido
+
+    def _olvidar(self, *claves):
+        with self._lock:
+            for clave in claves:
+                cuerpo = self._respuestas.pop(clave, None)
+                self._comprimidas.pop(cuerpo, None)
+
+    # MOODLE
+
+    def moodle(self, params):
+        # Devuelve (estado HTTP, cuerpo en bytes). Moodle responde 200 incluso con errores.
+        if params.get("wstoken") != self.token:
+            return 200, self._json(_error_moodle("invalidtoken", "Invalid token - token not found"))
+        funcion = params.get("wsfunction")
+        manejador = getattr(self, f"_ws_{funcion}", None)
+        if manejador is None:
+            return 200, self._json(_error_moodle(
+                "servicenotavailable", f"Web service {funcion} is not available", "webservice_access_exception"
+            ))
+        try:
+            return 200, manejador(params)
+        except (KeyError, ValueError) as e:
+            return 200, self._json(_error_moodle("invalidparameter", f"Invalid parameter value detected ({e})",
+                                                 "invalid_parameter_exception"))
+
+    def _ws_core_course_get_courses(self, params):
+        ids = {int(v) for v in _lista_indexada(params, "options[ids]")}
+        if ids:
+            return self._json([curso for curso in self.datos.cursos if curso["id"] in ids])
+        return self._serializada("cursos", lambda: self._json(self.datos.cursos))
+
+    def _ws_core_enrol_get_enrolled_users(self, params):
+        participantes = self.datos.participantes(int(params["courseid"]))
+        campos = None
+        for opcion in _lista_indexada(params, "options"):
+            if opcion.get("name") == "userfields":
+                campos = campos or set()
+                campos.update(c.strip() for c in opcion.get("value", "").split(","))
+        if campos:
+            # Como Moodle: el id siempre se incluye
+            campos.add("id")
+            participantes = [{k: v for k, v in u.items() if k in campos} for u in participantes]
+        return self._json(participantes)
+
+    def _ws_core_course_get_courses_by_field(self, params):
+        campo, valor = params["field"], params["value"]
+        cursos = [curso for curso in self.datos.cursos if str(curso.get(campo)) == valor]
+        return self._json({"courses": cursos, "warnings": []})
+
+    def _ws_core_user_get_users_by_field(self, params):
+        campo = params["field"]
+        valores = _lista_indexada(params, "values")
+        if campo == "id":
+            usuarios = [self.datos.usuarios[int(v)] for v in valores if int(v) in self.datos.usuarios]
+        else:
+            buscados = set(valores)
+            usuarios = [u for u in self.datos.usuarios.values() if str(u.get(campo)) in buscados]
+        return self._json(usuarios)
+
+    def _ws_core_user_get_users(self, params):
+        # Solo criterios de igualdad; "%" como valor devuelve todos los usuarios
+        usuarios = list(self.datos.usuarios.values())
+        for criterio in _lista_indexada(params, "criteria"):
+            clave, valor = criterio["key"], criterio["value"]
+            if valor != "%":
+                usuarios = [u for u in usuarios if str(u.get(clave)) == valor]
+        return self._json({"users": usuarios, "warnings": []})
+
+    def _ws_enrol_manual_enrol_users(self, params):
+        matriculas = _lista_indexada(params, "enrolments")
+        # Como en Moodle, una matrícula no válida rechaza el lote completo
+        existentes = {curso["id"] for curso in self.datos.cursos}
+        for matricula in matriculas:
+            if int(matricula["userid"]) not in self.datos.usuarios or int(matricula["courseid"]) not in existentes:
+                return self._json(_error_moodle("invalidrecord", "Can't find data record in database table user.",
+                                                "dml_missing_record_exception"))
+        for matricula in matriculas:
+            self.datos.matricular(int(matricula["courseid"]), int(matricula["userid"]))
+        return b"null"
+
+    def _ws_core_course_create_courses(self, params):
+        cursos = _lista_indexada(params, "courses")
+        # Como en Moodle, no se crea ninguno si algún nombre corto ya está en uso
+        existentes = {curso["shortname"] for curso in self.datos.cursos}
+        for curso in cursos:
+            if curso["shortname"] in existentes:
+                return self._json(_error_moodle("shortnametaken", f"Short name is already used for another course "
+                                                f"({curso['shortname']})", "invalid_parameter_exception"))
+        creados = []
+        for curso in cursos:
+            course_id = self.datos.crear_curso(curso["fullname"], curso["shortname"], curso["categoryid"])
+            creados.append({"id": course_id, "shortname": curso["shortname"]})
+        self._olvidar("cursos")
+        return self._json(creados)
+
+    def _ws_core_course_import_course(self, params):
+        # El contenido no se simula: solo se comprueba que ambos cursos existan
+        existentes = {curso["id"] for curso in self.datos.cursos}
+        for clave in ("importfrom", "importto"):
+            if int(params[clave]) not in existentes:
+                return self._json(_error_moodle("invalidrecord", "Can't find data record in database table course.",
+                                                "dml_missing_record_exception"))
+        return b"null"
+
+    # WORDPRESS
+
+    def wordpress(self, ruta, params):
+        if params.get("key") != self.clave:
+            return 403, self._json({"code": "rest_forbidden", "message": "Clave no válida", "data": {"status": 403}})
+        if ruta == "verificar":
+            return 200, self._json({"status": "ok"})
+        if ruta == "pedidos":
+            desde = params.get("desde")
+            if desde:
+                return 200, self._tabla(self.datos.pedidos_desde(desde))
+            return 200, self._serializada("pedidos", lambda: self._tabla(self.datos.pedidos))
+        if ruta == "productos":
+            return 200, self._serializada("productos", lambda: self._tabla(self.datos.productos))
+        if ruta == "miembros":
+            return 200, self._serializada("miembros", lambda: self._tabla(self.datos.miembros))
+        return 404, self._json({"code": "rest_no_route", "message": "No route was found", "data": {"status": 404}})
+
+    @staticmethod
+    def _json(valor):
+        return json.dumps(valor, ensure_ascii=False).encode("utf-8")
+
+    @staticmethod
+    def _tabla(df):
+        return df.to_json(orient="records", force_ascii=False).encode("utf-8")
+
+
+def crear_servidor(api, puerto=0, latencia=0.0, variacion=0.0, ancho_banda=None):
+    # latencia y variacion en segundos por petición; ancho_banda en bytes por segundo
+    class Manejador(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, formato, *args):
+            pass
+
+        def _params(self, texto):
+            return {clave: valores[-1] for clave, valores in parse_qs(texto, keep_blank_values=True).items()}
+
+        def _responder(self, estado, cuerpo):
+            api.peticiones += 1
+            comprimido = len(cuerpo) >= MINIMO_GZIP and "gzip" in self.headers.get("Accept-Encoding", "")
+            if comprimido:
+                cuerpo = api.comprimir(cuerpo)
+            espera = latencia + random.uniform(0, variacion)
+            if ancho_banda:
+                espera += len(cuerpo) / ancho_banda
+            if espera > 0:
+                time.sleep(espera)
+            self.send_response(estado)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(cuerpo)))
+            if comprimido:
+                self.send_header("Content-Encoding", "gzip")
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def do_POST(self):
+            url = urlsplit(self.path)
+            largo = int(self.headers.get("Content-Length") or 0)
+            params = self._params(self.rfile.read(largo).decode("utf-8"))
+            params.update(self._params(url.query))
+            if url.path != RUTA_MOODLE:
+                self._responder(404, b'{"error": "not found"}')
+                return
+            self._responder(*api.moodle(params))
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            params = self._params(url.query)
+            if url.path == RUTA_MOODLE:
+                self._responder(*api.moodle(params))
+            elif url.path.startswith(PREFIJO_WP):
+                self._responder(*api.wordpress(url.path[len(PREFIJO_WP):].strip("/"), params))
+            else:
+                self._responder(404, b'{"error": "not found"}')
+
+    servidor = ThreadingHTTPServer(("127.0.0.1", puerto), Manejador)
+    servidor.daemon_threads = True
+    return servidor
+
+
+def urls(servidor):
+    base = f"http://127.0.0.1:{servidor.server_address[1]}"
+    return {"MOODLE_URL": base + RUTA_MOODLE, "REDCOES_WP_URL": base + PREFIJO_WP.rstrip("/")}
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Servidor simulado de Moodle y WordPress para REDCOES")
+    parser.add_argument("--escala", choices=list(ESCALAS), default="pequena")
+    parser.add_argument("--puerto", type=int, default=0, help="0 = puerto libre cualquiera")
+    parser.add_argument("--latencia", type=float, default=0.0, help="segundos añadidos a cada respuesta")
+    parser.add_argument("--variacion", type=float, default=0.0, help="segundos aleatorios extra (0..variacion)")
+    parser.add_argument("--ancho-banda", type=float, default=None, help="bytes por segundo simulados")
+    args = parser.parse_args(argumentos)
+
+    inicio = time.perf_counter()
+    api = ApiSimulada(DatosSinteticos(args.escala))
+    servidor = crear_servidor(api, args.puerto, args.latencia, args.variacion, args.ancho_banda)
+    print(f"Datos '{args.escala}' generados en {time.perf_counter() - inicio:.1f} s", file=sys.stderr)
+    # La primera línea de stdout la lee el ejecutor de benchmarks
+    print(json.dumps(urls(servidor)), flush=True)
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+
+if __name__ == "__main__":
+    main()
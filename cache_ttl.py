@@ -0,0 +1,141 @@
+# REDCOES - Caché en memoria con expiración por entrada y desalojo LRU
+
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future
+
+_AUSENTE = object()
+_INTERRUMPIDO = object()
+
+
+class CacheTTL:
+    def __init__(self, max_entradas=1000, ttl=600):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self._datos = OrderedDict()  # clave -> (expira_en, valor)
+        self._lecturas = {}  # clave -> última lectura (monotonic)
+        self._lock = threading.Lock()
+
+    def obtener(self, clave, por_defecto=None):
+        with self._lock:
+            entrada = self._datos.get(clave, _AUSENTE)
+            if entrada is _AUSENTE:
+                return por_defecto
+            expira_en, valor = entrada
+            ahora = time.monotonic()
+            if expira_en is not None and expira_en <= ahora:
+                del self._datos[clave]
+                self._lecturas.pop(clave, None)
+                return por_defecto
+            # Marcar como usada recientemente
+            self._datos.move_to_end(clave)
+            self._lecturas[clave] = ahora
+            return valor
+
+    def guardar(self, clave, valor, ttl=None):
+        # ttl en segundos; 0 significa que la entrada no expira
+        ttl = self.ttl if ttl is None else ttl
+        expira_en = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._datos[clave] = (expira_en, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                desalojada, _ = self._datos.popitem(last=False)
+                self._lecturas.pop(desalojada, None)
+
+    def invalidar(self, clave):
+        with self._lock:
+            self._datos.pop(clave, None)
+            self._lecturas.pop(clave, None)
+
+    def claves(self):
+        with self._lock:
+            return list(self._datos)
+
+    def claves_en_uso(self, segundos):
+        # Claves vigentes que se leyeron en los últimos `segundos`. Guardar no
+        # cuenta como lectura: lo que nadie consulta termina venciendo.
+        ahora = time.monotonic()
+        with self._lock:
+            return [
+                clave for clave, (expira_en, _) in self._datos.items()
+                if (expira_en is None or expira_en > ahora) and ahora - self._lecturas.get(clave, float("-inf")) <= segundos
+            ]
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+            self._lecturas.clear()
+
+    def __contains__(self, clave):
+        return self.obtener(clave, _AUSENTE) is not _AUSENTE
+
+    def __len__(self):
+        return len(self._datos)
+
+
+class MemoDebil:
+    # Resultados derivados de un objeto no hashable (p. ej. un DataFrame) que se
+    # conservan mientras el objeto siga vivo; se indexan por id(objeto) + clave
+    def __init__(self):
+        self._datos = {}  # (id, clave) -> (referencia débil, valor)
+        self._lock = threading.Lock()
+
+    def obtener(self, objeto, clave, construir):
+        llave = (id(objeto), clave)
+        with self._lock:
+            entrada = self._datos.get(llave)
+            if entrada is not None and entrada[0]() is objeto:
+                return entrada[1]
+
+        valor = construir()
+        with self._lock:
+            self._datos[llave] = (weakref.ref(objeto, lambda _ref: self._descartar(llave)), valor)
+        return valor
+
+    def _descartar(self, llave):
+        with self._lock:
+            self._datos.pop(llave, None)
+
+
+class UnVuelo:
+    # Single-flight: las llamadas simultáneas con la misma clave esperan a una sola
+    # ejecución y reciben su mismo resultado (o la misma excepción)
+    def __init__(self):
+        self._vuelos = {}  # clave -> Future
+        self._lock = threading.Lock()
+
+    def ejecutar(self, clave, funcion):
+        with self._lock:
+            futuro = self._vuelos.get(clave)
+            lider = futuro is None
+            if lider:
+                futuro = self._vuelos[clave] = Future()
+        if not lider:
+            resultado = futuro.result()
+            if resultado is _INTERRUMPIDO:
+                return self.ejecutar(clave, funcion)
+            return resultado
+
+        try:
+            resultado = funcion()
+        except Exception as e:
+            futuro.set_exception(e)
+            raise
+        except BaseException:
+            # El líder se interrumpió (p. ej. Streamlit detuvo su rerun): los que
+            # esperaban vuelven a intentarlo en lugar de recibir esa interrupción
+            futuro.set_result(_INTERRUMPIDO)
+            raise
+        else:
+            futuro.set_result(resultado)
+            return resultado
+        finally:
+            with self._lock:
+                del self._vuelos[clave]
+
+    def en_curso(self, clave):
+        with self._lock:
+            return clave in self._vuelos
@@ -0,0 +1,235 @@
+# REDCOES - Conciliación entre pedidos pagados (WordPress) y matrículas (Moodle)
+
+import os
+import threading
+import weakref
+import numpy as np
+import pandas as pd
+from almacen_local import conectar
+from cache_ttl import MemoDebil
+from metricas import medir
+from tablas import normalizar_texto
+
+# Estados de WooCommerce que cuentan como pagados
+ESTADOS_PAGADOS = [e.strip() for e in os.getenv("REDCOES_ESTADOS_PAGADOS", "completed,processing").split(",") if e.strip()]
+# Roles de Moodle que cuentan como matrícula de participante (se excluyen docentes, etc.)
+ROLES_PARTICIPANTE = {"student"}
+
+_memo = MemoDebil()
+
+
+def normalizar_email(serie):
+    correos = serie.astype("string").str.strip().str.lower()
+    return correos.mask(correos == "")
+
+
+def _normalizar_nombre(serie):
+    return normalizar_texto(serie).str.replace(r"\s+", " ", regex=True).str.strip()
+
+
+# MAPEO PRODUCTO -> CURSO
+
+def cargar_mapeo():
+    conexion = conectar()
+    try:
+        conexion.execute("CREATE TABLE IF NOT EXISTS mapeo_productos (producto TEXT PRIMARY KEY, course_id INTEGER)")
+        return dict(conexion.execute("SELECT producto, course_id FROM mapeo_productos").fetchall())
+    finally:
+        conexion.close()
+
+
+def guardar_mapeo(mapeo):
+    # mapeo: {producto: course_id o None}; None borra la asociación
+    conexion = conectar()
+    try:
+        with conexion:
+            conexion.execute("CREATE TABLE IF NOT EXISTS mapeo_productos (producto TEXT PRIMARY KEY, course_id INTEGER)")
+            conexion.executemany(
+                "INSERT OR REPLACE INTO mapeo_productos (producto, course_id) VALUES (?, ?)",
+                [(p, int(c)) for p, c in mapeo.items() if c is not None and not pd.isna(c)]
+            )
+            conexion.executemany(
+                "DELETE FROM mapeo_productos WHERE producto = ?",
+                [(p,) for p, c in mapeo.items() if c is None or pd.isna(c)]
+            )
+    finally:
+        conexion.close()
+
+
+def _indice_cursos(cursos_df):
+    # Índice hash nombre normalizado -> id de curso (fullname y shortname); solo
+    # entran los nombres que corresponden a un único curso
+    def construir():
+        cursos = cursos_df[["id", "fullname", "shortname"]] if "shortname" in cursos_df else cursos_df[["id", "fullname"]]
+        claves = pd.concat([
+            pd.DataFrame({"clave": _normalizar_nombre(cursos[col]), "id": cursos["id"]}) for col in cursos.columns if col != "id"
+        ], ignore_index=True).drop_duplicates()
+        unicos = claves.groupby("clave")["id"].agg(["first", "size"])
+        return unicos.loc[unicos["size"] == 1, "first"]
+    return _memo.obtener(cursos_df, "indice_cursos", construir)
+
+
+def sugerir_mapeo(productos, cursos_df):
+    indice = _indice_cursos(cursos_df)
+
+    productos = pd.Series(pd.unique(pd.Series(productos).dropna().astype(str)))
+    sugeridos = _normalizar_nombre(productos).map(indice)
+    return {p: int(c) for p, c in zip(productos, sugeridos) if pd.notna(c)}
+
+
+# PEDIDOS PREPARADOS (INCREMENTAL)
+
+class PedidosPreparados:
+    # Normalizar los correos de todos los pedidos es lo costoso de la conciliación.
+    # Se guarda el resultado por id de pedido: cuando llegan pedidos nuevos solo se
+    # procesan esos y los que cambiaron de estado o producto.
+    COLUMNAS = ["producto", "estado", "email", "nombre", "fecha_pedido"]
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._base = None  # DataFrame indexado por id
+        self._origen = None  # referencia débil al último DataFrame de pedidos procesado
+
+    def _preparar(self, pedidos):
+        columnas = [c for c in self.COLUMNAS if c in pedidos.columns]
+        preparados = pedidos[columnas].copy()
+        preparados["producto"] = preparados["producto"].astype("string")
+        preparados["estado"] = preparados["estado"].astype("string")
+        preparados["email"] = normalizar_email(pedidos["email"])
+        return preparados
+
+    def obtener(self, pedidos):
+        with self._lock:
+            if self._origen is not None and self._origen() is pedidos:
+                return self._base
+
+            if "id" not in pedidos.columns or pedidos["id"].isna().any() or not pedidos["id"].is_unique:
+                # Sin id estable no se puede saber qué cambió
+                with medir("conciliacion_preparar_todo"):
+                    base = self._preparar(pedidos)
+            elif self._base is None:
+                with medir("conciliacion_preparar_todo"):
+                    base = self._preparar(pedidos.set_index("id"))
+            else:
+                with medir("conciliacion_preparar_incremental"):
+                    actuales = pedidos.set_index("id")
+                    anterior = self._base[self._base.index.isin(actuales.index)]
+                    comunes = actuales.loc[anterior.index]
+                    sin_cambios = np.asarray(
+                        (comunes["estado"].astype("string").fillna("").to_numpy() == anterior["estado"].fillna("").to_numpy())
+                        & (comunes["producto"].astype("string").fillna("").to_numpy() == anterior["producto"].fillna("").to_numpy()),
+                        dtype=bool
+                    )
+                    pendientes = actuales[~actuales.index.isin(anterior.index[sin_cambios])]
+                    base = pd.concat([anterior[sin_cambios], self._preparar(pendientes)])
+            self._base = base
+            self._origen = weakref.ref(pedidos)
+            return base
+
+
+pedidos_preparados = PedidosPreparados()
+
+
+# MATRÍCULAS
+
+def matriculas_df(participantes_por_curso):
+    # {course_id: [usuarios de Moodle]} -> DataFrame con una fila por matrícula de participante
+    filas = [
+        (course_id, u.get("email"), u.get("fullname"))
+        for course_id, usuarios in participantes_por_curso.items()
+        for u in usuarios
+        if not u.get("roles") or any(r.get("shortname") in ROLES_PARTICIPANTE for r in u["roles"])
+    ]
+    df = pd.DataFrame(filas, columns=["course_id", "email", "nombre_moodle"])
+    df["course_id"] = df["course_id"].astype("int64")
+    df["email"] = normalizar_email(df["email"])
+    return df
+
+
+# CONCILIACIÓN
+
+def _comprobar_columnas(pedidos):
+    faltantes = [c for c in ("producto", "estado", "email") if c not in pedidos.columns]
+    if faltantes:
+        raise ValueError("Los pedidos no traen las columnas: " + ", ".join(faltantes))
+
+
+def productos_pagados(pedidos):
+    # Pedidos pagados por producto, de mayor a menor; se calcula una vez por DataFrame
+    _comprobar_columnas(pedidos)
+    def construir():
+        base = pedidos_preparados.obtener(pedidos)
+        conteo = base.loc[base["estado"].isin(ESTADOS_PAGADOS), "producto"].value_counts()
+        return conteo[conteo > 0]
+    return _memo.obtener(pedidos, "productos_pagados", construir)
+
+
+def conciliar(pedidos, mapeo, matriculas, cursos_df=None):
+    # Cruza (curso, correo) de los pedidos pagados con las matrículas de los cursos
+    # mapeados. Devuelve (pagados sin matrícula, matriculados sin pago).
+    # Con cursos_df se agrega a ambos la columna "curso" con el nombre del curso.
+    _comprobar_columnas(pedidos)
+    base = pedidos_preparados.obtener(pedidos)
+    with medir("conciliacion_cruce"):
+        pagados = base[base["estado"].isin(ESTADOS_PAGADOS)].copy()
+        pagados["course_id"] = pagados["producto"].map(mapeo).astype("Int64")
+        pagados = pagados.dropna(subset=["course_id", "email"])
+        if "fecha_pedido" in pagados.columns:
+            pagados = pagados.sort_values("fecha_pedido", ascending=False)
+        # Una fila por persona y curso (el pedido más reciente)
+        pagados = pagados.drop_duplicates(["course_id", "email"])
+        pagados["course_id"] = pagados["course_id"].astype("int64")
+
+        matriculados = matriculas.dropna(subset=["email"]).drop_duplicates(["course_id", "email"])
+        cursos_mapeados = [int(c) for c in set(mapeo.values()) if c is not None and not pd.isna(c)]
+        matriculados = matriculados[matriculados["course_id"].isin(cursos_mapeados)]
+
+        pagados = pagados.reset_index(drop=pagados.index.name != "id")
+        cruce = pagados.merge(matriculados, on=["course_id", "email"], how="outer", indicator=True)
+        sin_matricula = cruce[cruce["_merge"] == "left_only"].drop(columns=["_merge", "nombre_moodle"])
+        sin_pago = cruce[cruce["_merge"] == "right_only"][["course_id", "email", "nombre_moodle"]]
+        sin_matricula = sin_matricula.reset_index(drop=True)
+        sin_pago = sin_pago.reset_index(drop=True)
+        if cursos_df is not None:
+            nombres_cursos = cursos_df.set_index("id")["fullname"]
+            sin_matricula.insert(1, "curso", sin_matricula["course_id"].map(nombres_cursos))
+            sin_pago.insert(1, "curso", sin_pago["course_id"].map(nombres_cursos))
+    return sin_matricula, sin_pago
+
+
+class ConciliacionVigente:
+    # Guarda el último resultado mientras no cambien los pedidos (mismo DataFrame),
+    # los cursos, el mapeo ni las listas de matrículas en caché. Así los reruns reutilizan los
+    # mismos DataFrames y, con ellos, el orden y el índice de búsqueda de las tablas.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._firma = None  # (ref. débil a pedidos, ref. débil a cursos, mapeo, listas)
+        self._resultado = None
+
+    def _vigente(self, pedidos, cursos_df, mapeo, listas):
+        if self._firma is None:
+            return False
+        ref_pedidos, ref_cursos, mapeo_guardado, listas_guardadas = self._firma
+        return (
+            ref_pedidos() is pedidos and ref_cursos() is cursos_df and mapeo_guardado == mapeo
+            and len(listas_guardadas) == len(listas)
+            and all(a[0] == b[0] and a[1] is b[1] for a, b in zip(listas_guardadas, listas))
+        )
+
+    def obtener(self, pedidos, mapeo, participantes_por_curso, cursos_df):
+        mapeo = tuple(sorted(mapeo.items()))
+        listas = tuple(sorted(participantes_por_curso.items(), key=lambda par: par[0]))
+        with self._lock:
+            if self._vigente(pedidos, cursos_df, mapeo, listas):
+                return self._resultado
+
+        with medir("conciliacion_matriculas"):
+            matriculas = matriculas_df(participantes_por_curso)
+        resultado = conciliar(pedidos, dict(mapeo), matriculas, cursos_df)
+        with self._lock:
+            self._firma = (weakref.ref(pedidos), weakref.ref(cursos_df), mapeo, listas)
+            self._resultado = resultado
+        return resultado
+
+
+conciliacion_vigente = ConciliacionVigente()
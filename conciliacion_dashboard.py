@@ -0,0 +1,113 @@
+import streamlit as st
+import pandas as pd
+import wordpress_api
+import moodle_dashboard
+from moodle_api import obtener_en_paralelo, obtener_participantes, MoodleError
+from almacen_local import cargar_con_snapshot, solicitar_actualizacion
+from planificador import mostrar_estado
+from esquemas import ErrorEsquema
+from conciliacion import cargar_mapeo, guardar_mapeo, sugerir_mapeo, productos_pagados, conciliacion_vigente
+from exportacion import boton_exportar
+from tablas import tabla_paginada
+from metricas import pestana, iniciar_rerun, terminar_rerun, mostrar_panel
+
+DATASETS = ["pedidos", "cursos", "participantes"]
+
+
+def main():
+    clave_api = st.session_state.get("clave_redcoes", None)
+
+    if not clave_api:
+        st.warning("🔒 Acceso restringido. No se detectó una clave válida.")
+        st.stop()
+
+    if st.session_state.get("refrescar"):
+        solicitar_actualizacion(*DATASETS)
+
+    st.header("🔗 Conciliación de pagos y matrículas")
+
+    try:
+        pedidos = cargar_con_snapshot("pedidos", lambda: wordpress_api.cargar_pedidos(clave_api))[0]
+        cursos_df = cargar_con_snapshot("cursos", moodle_dashboard.cargar_cursos)[0]
+        conteo_productos = productos_pagados(pedidos)
+    except (MoodleError, ErrorEsquema, ValueError) as e:
+        st.error(f"❌ No se pudieron cargar los datos: {e}")
+        st.stop()
+
+    # MAPEO PRODUCTO -> CURSO
+    # Se guarda en la base local; los productos sin asociación se sugieren por nombre
+    mapeo = cargar_mapeo()
+    sugerencias = sugerir_mapeo(conteo_productos.index, cursos_df)
+    nombres_cursos = cursos_df.set_index("id")["fullname"]
+
+    with st.expander(f"🧭 Asociación de productos con cursos ({len(mapeo)} guardadas)", expanded=not mapeo):
+        editable = pd.DataFrame({
+            "Producto": conteo_productos.index.astype(str),
+            "Pedidos pagados": conteo_productos.to_numpy(),
+        })
+        editable["ID de curso"] = editable["Producto"].map(lambda p: mapeo.get(p, sugerencias.get(p))).astype("Int64")
+        editable["Curso"] = editable["ID de curso"].map(nombres_cursos)
+        editable["Sugerido"] = editable["Producto"].map(lambda p: p not in mapeo and p in sugerencias)
+
+        # En un formulario para no recalcular la conciliación con cada celda editada
+        with st.form("form_mapeo"):
+            editado = st.data_editor(
+                editable, key="editor_mapeo", hide_index=True, use_container_width=True,
+                disabled=["Producto", "Pedidos pagados", "Curso", "Sugerido"],
+                column_config={"ID de curso": st.column_config.NumberColumn("ID de curso", min_value=1, step=1)},
+            )
+            if st.form_submit_button("💾 Guardar asociaciones"):
+                nuevo = dict(zip(editado["Producto"], editado["ID de curso"]))
+                desconocidos = {p: c for p, c in nuevo.items() if pd.notna(c) and int(c) not in nombres_cursos.index}
+                if desconocidos:
+                    st.error("❌ Estos productos apuntan a cursos que no existen: " + ", ".join(desconocidos))
+                else:
+                    guardar_mapeo(nuevo)
+                    st.success("✅ Asociaciones guardadas.")
+                    mapeo = cargar_mapeo()
+
+    if not mapeo:
+        st.info("Asocia al menos un producto con su curso para conciliar.")
+        mostrar_estado(DATASETS)
+        return
+
+    # MATRÍCULAS DE LOS CURSOS ASOCIADOS
+    course_ids = sorted(set(mapeo.values()))
+    with st.spinner(f"Cargando matrículas de {len(course_ids)} cursos..."):
+        participantes, errores = obtener_en_paralelo(obtener_participantes, course_ids)
+    if errores:
+        st.warning(f"⚠️ No se pudieron cargar las matrículas de {len(errores)} cursos; no se concilian: "
+                   + ", ".join(str(cid) for cid in errores))
+        mapeo = {p: c for p, c in mapeo.items() if c not in errores}
+
+    sin_matricula, sin_pago = conciliacion_vigente.obtener(pedidos, mapeo, participantes, cursos_df)
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Cursos conciliados", len(course_ids) - len(errores))
+    col2.metric("Pagados sin matrícula", len(sin_matricula))
+    col3.metric("Matriculados sin pago", len(sin_pago))
+
+    secciones = {
+        "💳 Pagados sin matrícula": (sin_matricula, "pagados_sin_matricula", ("fecha_pedido", True)),
+        "🎓 Matriculados sin pago": (sin_pago, "matriculados_sin_pago", ("course_id", True)),
+    }
+    seccion = st.radio("Sección", list(secciones), horizontal=True, key="seccion_conciliacion",
+                       label_visibility="collapsed")
+    with pestana(seccion):
+        df, clave, orden = secciones[seccion]
+        if df.empty:
+            st.success("✅ Sin diferencias.")
+        else:
+            orden = orden if orden[0] in df.columns else None
+            tabla_paginada(df, f"tabla_{clave}", columnas_busqueda=["email", "curso"], orden_inicial=orden)
+            boton_exportar(lambda: df, clave, f"exportar_{clave}", hoja=seccion[2:],
+                           firma=(len(df), tuple(sorted(mapeo.items()))))
+
+    mostrar_estado(DATASETS)
+
+if __name__ == "__main__":
+    iniciar_rerun("Conciliación")
+    main()
+    st.session_state["refrescar"] = False
+    terminar_rerun()
+    mostrar_panel()
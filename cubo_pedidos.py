@@ -0,0 +1,69 @@
+# REDCOES - Cubo preagregado de pedidos para filtros y gráficos
+
+import pandas as pd
+from cache_ttl import MemoDebil
+from metricas import medir
+
+# Grano del cubo: día × producto × modalidad × afiliación × estado (año y mes
+# se derivan del día). Los filtros del dashboard son todos dimensiones del cubo.
+DIMENSIONES = ['año', 'mes_numero', 'mes', 'dia', 'producto', 'modalidad', 'tipo_de_afiliacion', 'estado']
+
+_cubos = MemoDebil()
+
+
+def construir_cubo(df):
+    base = df[['año', 'mes_numero', 'mes', 'producto', 'modalidad', 'tipo_de_afiliacion', 'estado', 'total']].copy()
+    base['dia'] = df['fecha_pedido'].dt.normalize()
+    return (
+        base.groupby(DIMENSIONES, observed=True, dropna=False, sort=False)
+        .agg(pedidos=('total', 'size'), total=('total', 'sum'))
+        .reset_index()
+    )
+
+
+def cubo_para(df):
+    # Un cubo por carga de datos: se reutiliza mientras el DataFrame siga vivo
+    def construir():
+        with medir("construir_cubo"):
+            return construir_cubo(df)
+    return _cubos.obtener(df, "cubo", construir)
+
+
+def mascara_filtros(tabla, selecciones, rango_meses=None):
+    # Sirve tanto para el cubo como para las filas originales (mismas columnas)
+    mascara = pd.Series(True, index=tabla.index)
+    for col, valores in selecciones.items():
+        if valores:
+            mascara &= tabla[col].isin(valores)
+    if rango_meses is not None:
+        inicio, fin = rango_meses
+        if inicio <= fin:
+            # mes_numero es Int8 nullable: los pedidos sin fecha quedan fuera, no como <NA>
+            mascara &= tabla['mes_numero'].between(inicio, fin).fillna(False).astype(bool)
+    return mascara
+
+
+def filtrar(tabla, selecciones, rango_meses=None):
+    return tabla[mascara_filtros(tabla, selecciones, rango_meses)]
+
+
+# CONSULTAS SOBRE EL CUBO
+
+def resumen(cubo):
+    return {
+        "pedidos": int(cubo['pedidos'].sum()),
+        "total": float(cubo['total'].sum()),
+        "productos": cubo['producto'].nunique(),
+    }
+
+
+def por_dimension(cubo, dimension, columnas):
+    # Equivalente a value_counts() de la columna en las filas originales
+    conteos = cubo.groupby(dimension, observed=True)['pedidos'].sum()
+    conteos = conteos[conteos > 0].sort_values(ascending=False).reset_index()
+    conteos.columns = columnas
+    return conteos
+
+
+def por_fecha(cubo):
+    return cubo.groupby('dia')['pedidos'].sum().reset_index(name='Cantidad').rename(columns={'dia': 'fecha_pedido'})
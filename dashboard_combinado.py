@@ -1,31 +1,67 @@
 # REDCOES - Dashboard Combinado (Moodle + WordPress)
 
+import importlib
+import sys
+import threading
 import streamlit as st
-import moodle_dashboard
-import wordpress_dashboard
-import requests
+from verificacion import verificar
+from metricas import iniciar_rerun, terminar_rerun, mostrar_panel
+
+# Cada dashboard (y pandas, plotly, etc.) se importa recién cuando se elige en la
+# barra lateral; la pantalla de acceso solo necesita streamlit y requests
+MODULOS = {"Moodle": "moodle_dashboard", "WordPress": "wordpress_dashboard", "Conciliación": "conciliacion_dashboard"}
+
+
+def cargar_modulo(opcion):
+    nombre = MODULOS[opcion]
+    if nombre in sys.modules:
+        return sys.modules[nombre]
+    with st.spinner(f"Cargando módulo {opcion}..."):
+        return importlib.import_module(nombre)
+
+
+@st.cache_resource(show_spinner=False)
+def precargar_modulos():
+    # Una vez por proceso, después de dibujar la pantalla de acceso: los módulos se
+    # importan en segundo plano mientras se escribe la clave
+    hilo = threading.Thread(
+        target=lambda: [importlib.import_module(nombre) for nombre in MODULOS.values()],
+        name="precarga-redcoes", daemon=True
+    )
+    hilo.start()
+    return hilo
+
 
 # Configuración inicial
 st.set_page_config(page_title="Dashboard General REDCOES", layout="wide")
+metricas_rerun = iniciar_rerun()
 
 # Título
 st.title("🔐 Acceso al Dashboard General REDCOES")
 
 # Campo de clave sin sugerencias del navegador
-clave_ingresada = st.text_input("Ingresa la clave de acceso:", type="password", autocomplete="off")
+clave_ingresada = st.text_input("Ingresa la clave de acceso:", type="password", autocomplete="off", key="clave_ingresada")
+precargar_modulos()
+
+
+def cerrar_sesion():
+    # Revoca solo esta sesión: la próxima clave vuelve a verificarse
+    st.session_state.pop("token_redcoes", None)
+    st.session_state.pop("clave_redcoes", None)
+    st.session_state["clave_ingresada"] = ""
 
-# Usar endpoint más liviano
-url_verificacion = f"https://reddecontadores.com/wp-json/redcoes/v1/verificar?key={clave_ingresada}"
 
-# Validar clave usando el endpoint de verificación
+# Validar clave: el endpoint de verificación solo se consulta si la sesión no tiene un token vigente
 if clave_ingresada:
     try:
-        respuesta = requests.get(url_verificacion, timeout=5)
-        if respuesta.status_code == 200 and respuesta.json().get("status") == "ok":
+        valida, token = verificar(clave_ingresada, st.session_state.get("token_redcoes"))
+        if valida:
+            st.session_state["token_redcoes"] = token
             st.success("🔓 Acceso concedido")
 
             # Guardar clave para dashboards
             st.session_state["clave_redcoes"] = clave_ingresada
+            st.sidebar.button("🔒 Cerrar sesión", on_click=cerrar_sesion)
 
             # Inicializar la clave 'refrescar' si no existe
             if "refrescar" not in st.session_state:
@@ -37,15 +73,21 @@ if clave_ingresada:
                 st.rerun()  # Recargar la app para que el valor se propague a los dashboards
 
             # Selector de dashboard
-            opcion = st.sidebar.radio("Selecciona el módulo:", ["Moodle", "WordPress"])
-            if opcion == "Moodle":
-                moodle_dashboard.main()
-            elif opcion == "WordPress":
-                wordpress_dashboard.main()
+            opcion = st.sidebar.radio("Selecciona el módulo:", list(MODULOS))
+            metricas_rerun["modulo"] = opcion
+            cargar_modulo(opcion).main()
+
+            # El refresco ya se aplicó en este rerun; los siguientes vuelven a usar las cachés
+            st.session_state["refrescar"] = False
 
         else:
+            st.session_state.pop("token_redcoes", None)
             st.error("❌ Clave incorrecta o acceso denegado.")
     except Exception as e:
         st.error(f"⚠️ Error al validar la clave: {e}")
 else:
     st.info("🔐 Por favor, ingresa tu clave para continuar.")
+
+# Tiempos del rerun completo (panel visible con REDCOES_PANEL_RENDIMIENTO=1)
+terminar_rerun()
+mostrar_panel()
@@ -0,0 +1,131 @@
+# REDCOES - Esquemas declarados y conversión tipada de los datasets
+
+import logging
+import os
+import pandas as pd
+
+FORMATOS_FECHA = os.getenv("REDCOES_FORMATOS_FECHA", "%Y-%m-%d %H:%M:%S;%Y-%m-%d").split(";")
+ESTRICTO = os.getenv("REDCOES_ESQUEMA_ESTRICTO", "1") == "1"
+# Valores que WordPress usa para "sin dato"
+VALORES_VACIOS = {"", "0000-00-00", "0000-00-00 00:00:00"}
+
+logger = logging.getLogger(__name__)
+
+# Tipos: "entero" y "decimal" numéricos (los enteros se reducen al menor tipo posible;
+# los decimales son montos y se mantienen en float64), "fecha" texto con FORMATOS_FECHA,
+# "timestamp" segundos Unix, "categoria" texto de baja cardinalidad, "texto" sin cambios.
+ESQUEMAS = {
+    "pedidos": {
+        "columnas": {
+            "id": "entero",
+            "total": "decimal",
+            "fecha_pedido": "fecha",
+            "producto": "categoria",
+            "modalidad": "categoria",
+            "tipo_de_afiliacion": "categoria",
+            "estado": "categoria",
+        },
+        "opcionales": {"id"},
+    },
+    "productos": {
+        "columnas": {
+            "id": "entero",
+            "nombre": "texto",
+            "precio_regular": "decimal",
+            "estado": "categoria",
+            "modalidad": "categoria",
+            "tipo_afiliacion": "categoria",
+        },
+        "opcionales": set(),
+    },
+    "miembros": {
+        "columnas": {
+            "email": "texto",
+            "subscription_starts": "fecha",
+            "membership_level": "categoria",
+            "account_state": "categoria",
+        },
+        "opcionales": set(),
+    },
+    "cursos": {
+        "columnas": {
+            "id": "entero",
+            "fullname": "texto",
+            "startdate": "timestamp",
+            "enddate": "timestamp",
+        },
+        "opcionales": set(),
+    },
+}
+
+
+class ErrorEsquema(ValueError):
+    pass
+
+
+def _vacios(serie):
+    return serie.isna() | serie.astype(str).str.strip().isin(VALORES_VACIOS)
+
+
+def _reportar(nombre, col, serie, invalidos):
+    cantidad = int(invalidos.sum())
+    if not cantidad:
+        return
+    ejemplos = ", ".join(serie[invalidos].astype(str).unique()[:3])
+    mensaje = f"{nombre}.{col}: {cantidad} valor(es) no válidos ({ejemplos})"
+    if ESTRICTO:
+        raise ErrorEsquema(mensaje)
+    logger.warning(mensaje)
+
+
+def _numero(nombre, col, serie, entero):
+    vacios = _vacios(serie)
+    valores = pd.to_numeric(serie.where(~vacios), errors="coerce")
+    _reportar(nombre, col, serie, valores.isna() & ~vacios)
+    if entero and not valores.isna().any():
+        return pd.to_numeric(valores, downcast="integer")
+    return valores.astype("float64")
+
+
+def _fecha(nombre, col, serie):
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+    vacios = _vacios(serie)
+    texto = serie.where(~vacios).astype("string").str.strip()
+    fechas = pd.Series(pd.NaT, index=serie.index, dtype="datetime64[ns]")
+    pendientes = ~vacios
+    # Cada formato es un parseo vectorizado; solo se reintentan los que fallaron
+    for formato in FORMATOS_FECHA:
+        if not pendientes.any():
+            break
+        fechas[pendientes] = pd.to_datetime(texto[pendientes], format=formato, errors="coerce")
+        pendientes = pendientes & fechas.isna()
+    _reportar(nombre, col, serie, pendientes)
+    return fechas
+
+
+def aplicar_esquema(df, nombre):
+    esquema = ESQUEMAS[nombre]
+    faltantes = [col for col in esquema["columnas"] if col not in df.columns and col not in esquema["opcionales"]]
+    if faltantes:
+        raise ErrorEsquema(f"{nombre}: faltan columnas {', '.join(faltantes)}")
+
+    for col, tipo in esquema["columnas"].items():
+        if col not in df.columns:
+            continue
+        if tipo in ("entero", "decimal", "timestamp"):
+            df[col] = _numero(nombre, col, df[col], entero=tipo != "decimal")
+        elif tipo == "fecha":
+            df[col] = _fecha(nombre, col, df[col])
+        elif tipo == "categoria":
+            df[col] = df[col].astype("category")
+    return df
+
+
+def agregar_periodo(df, columna_fecha):
+    # Columnas derivadas de año y mes con tipos compactos
+    fechas = df[columna_fecha]
+    df['año'] = fechas.dt.year.astype("Int16")
+    df['mes_numero'] = fechas.dt.month.astype("Int8")
+    df['mes'] = fechas.dt.strftime('%B').astype("category")
+    return df
@@ -0,0 +1,80 @@
+# REDCOES - Exportación bajo demanda de tablas (Excel, CSV, Parquet)
+
+import io
+import streamlit as st
+from metricas import medir
+
+FILAS_POR_BLOQUE = 5000
+
+FORMATOS = {
+    "xlsx": ("Excel", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "csv": ("CSV", "text/csv"),
+    "parquet": ("Parquet", "application/vnd.apache.parquet"),
+}
+
+
+def _escribir_xlsx(df, salida, hoja):
+    # Libro en modo write-only: las filas se vuelcan al archivo a medida que se
+    # agregan, sin mantener todas las celdas en memoria. openpyxl se importa solo
+    # cuando alguien exporta a Excel.
+    from openpyxl import Workbook
+    libro = Workbook(write_only=True)
+    pagina = libro.create_sheet(title=hoja[:31])
+    pagina.append([str(col) for col in df.columns])
+    for inicio in range(0, len(df), FILAS_POR_BLOQUE):
+        bloque = df.iloc[inicio:inicio + FILAS_POR_BLOQUE].astype(object)
+        bloque = bloque.where(bloque.notna(), None)
+        for fila in bloque.itertuples(index=False, name=None):
+            pagina.append(fila)
+    libro.save(salida)
+
+
+def exportar(df, formato, hoja="Datos"):
+    salida = io.BytesIO()
+    with medir(f"exportar_{formato}") as medicion:
+        if formato == "xlsx":
+            _escribir_xlsx(df, salida, hoja)
+        elif formato == "csv":
+            # utf-8-sig para que Excel reconozca los acentos al abrir el CSV
+            df.to_csv(salida, index=False, encoding="utf-8-sig", chunksize=FILAS_POR_BLOQUE)
+        elif formato == "parquet":
+            df.to_parquet(salida, index=False)
+        else:
+            raise ValueError(f"Formato de exportación no soportado: {formato}")
+        medicion["bytes"] = salida.tell()
+    return salida.getvalue()
+
+
+def boton_exportar(obtener_df, nombre_archivo, clave, hoja="Datos", firma=None):
+    # El archivo solo se genera al pulsar "Preparar"; obtener_df es una función para
+    # que ni siquiera el filtrado de filas se ejecute mientras nadie exporte.
+    # firma identifica los filtros usados: si cambian, el archivo preparado se descarta.
+    clave_estado = f"exportacion_{clave}"
+    col_formato, col_boton = st.columns([1, 3])
+    formato = col_formato.selectbox(
+        "Formato", list(FORMATOS), format_func=lambda f: FORMATOS[f][0],
+        key=f"{clave_estado}_formato", label_visibility="collapsed"
+    )
+
+    if col_boton.button("⚙️ Preparar exportación", key=f"{clave_estado}_preparar"):
+        with st.spinner("Generando archivo..."):
+            st.session_state[clave_estado] = {
+                "formato": formato,
+                "firma": firma,
+                "datos": exportar(obtener_df(), formato, hoja),
+            }
+
+    preparado = st.session_state.get(clave_estado)
+    if preparado and (preparado["formato"] != formato or preparado["firma"] != firma):
+        del st.session_state[clave_estado]
+        preparado = None
+
+    if preparado:
+        etiqueta, mime = FORMATOS[formato]
+        st.download_button(
+            label=f"📥 Descargar en {etiqueta}",
+            data=preparado["datos"],
+            file_name=f"{nombre_archivo}.{formato}",
+            mime=mime,
+            key=f"{clave_estado}_descargar",
+        )
@@ -0,0 +1,213 @@
+# REDCOES - Instrumentación de tiempos, bytes transferidos y aciertos de caché
+
+import contextvars
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+PANEL_RENDIMIENTO = os.getenv("REDCOES_PANEL_RENDIMIENTO", "0") == "1"
+LOG_ESTRUCTURADO = os.getenv("REDCOES_METRICAS_LOG", "0") == "1"
+ARCHIVO_PROMETHEUS = os.getenv("REDCOES_METRICAS_ARCHIVO", "")
+INTERVALO_ARCHIVO = float(os.getenv("REDCOES_METRICAS_INTERVALO", "15"))
+RERUNS_GUARDADOS = 50
+
+logger = logging.getLogger("redcoes.metricas")
+
+# Rerun y pestaña en curso. Son variables de contexto para que las peticiones
+# lanzadas desde hilos auxiliares (copiando el contexto) se atribuyan al rerun
+# que las originó; las tareas del planificador quedan sin rerun.
+_rerun = contextvars.ContextVar("redcoes_rerun", default=None)
+_pestana = contextvars.ContextVar("redcoes_pestana", default=None)
+
+_lock = threading.Lock()
+_totales = {}  # (tipo, nombre) -> acumulados del proceso
+_reruns = deque(maxlen=RERUNS_GUARDADOS)
+_ids = itertools.count(1)
+_ultima_escritura = 0.0
+
+
+def registrar(nombre, tipo="etapa", segundos=0.0, bytes_=None, cache=None, error=False):
+    # tipo: moodle, wordpress, etapa, cache, pestana, segundo_plano o rerun.
+    # cache: "acierto", "fallo" o None si no aplica.
+    rerun = _rerun.get()
+    registro = {
+        "rerun": rerun["id"] if rerun else None,
+        "pestana": _pestana.get(),
+        "tipo": tipo,
+        "nombre": nombre,
+        "segundos": round(segundos, 6),
+        "bytes": bytes_,
+        "cache": cache,
+        "error": error,
+    }
+    with _lock:
+        total = _totales.setdefault((tipo, nombre), {
+            "llamadas": 0, "segundos": 0.0, "bytes": 0, "aciertos": 0, "fallos": 0, "errores": 0,
+        })
+        total["llamadas"] += 1
+        total["segundos"] += segundos
+        total["bytes"] += bytes_ or 0
+        total["aciertos"] += cache == "acierto"
+        total["fallos"] += cache == "fallo"
+        total["errores"] += bool(error)
+        if rerun is not None:
+            rerun["registros"].append(registro)
+    if LOG_ESTRUCTURADO:
+        logger.info(json.dumps(registro, ensure_ascii=False))
+
+
+def registrar_cache(nombre, acierto):
+    registrar(nombre, "cache", cache="acierto" if acierto else "fallo")
+
+
+@contextmanager
+def medir(nombre, tipo="etapa"):
+    # Entrega un diccionario donde el código medido puede anotar "bytes" y "cache"
+    medicion = {}
+    inicio = time.perf_counter()
+    error = False
+    try:
+        yield medicion
+    except Exception:
+        error = True
+        raise
+    finally:
+        registrar(nombre, tipo, time.perf_counter() - inicio,
+                  medicion.get("bytes"), medicion.get("cache"), error)
+
+
+@contextmanager
+def pestana(nombre):
+    ficha = _pestana.set(nombre)
+    try:
+        with medir(nombre, "pestana"):
+            yield
+    finally:
+        _pestana.reset(ficha)
+
+
+# RERUNS
+
+def iniciar_rerun(modulo=None):
+    rerun = {"id": next(_ids), "modulo": modulo, "inicio": time.time(), "segundos": None, "registros": []}
+    _rerun.set(rerun)
+    with _lock:
+        _reruns.append(rerun)
+    return rerun
+
+
+def terminar_rerun():
+    rerun = _rerun.get()
+    if rerun is None or rerun["segundos"] is not None:
+        return rerun
+    rerun["segundos"] = time.time() - rerun["inicio"]
+    registrar(rerun["modulo"] or "general", "rerun", rerun["segundos"])
+    escribir_prometheus()
+    return rerun
+
+
+def resumen_por_pestana(rerun):
+    # Tiempo de cada pestaña y lo que se pidió dentro de ella. Las etapas anidadas
+    # no se suman al tiempo: ese es el de la propia pestaña.
+    with _lock:
+        registros = list(rerun["registros"])
+    filas = {}
+    for registro in registros:
+        fila = filas.setdefault(registro["pestana"] or "(fuera de pestañas)", {
+            "segundos": 0.0, "peticiones": 0, "bytes": 0, "aciertos": 0, "fallos": 0,
+        })
+        if registro["tipo"] == "pestana":
+            fila["segundos"] += registro["segundos"]
+        elif registro["tipo"] in ("moodle", "wordpress"):
+            fila["peticiones"] += 1
+            fila["bytes"] += registro["bytes"] or 0
+        fila["aciertos"] += registro["cache"] == "acierto"
+        fila["fallos"] += registro["cache"] == "fallo"
+    return [{"pestaña": nombre, **fila} for nombre, fila in filas.items()]
+
+
+def totales():
+    with _lock:
+        return {clave: dict(valor) for clave, valor in _totales.items()}
+
+
+# EXPORTACIÓN EN FORMATO PROMETHEUS
+
+def _etiqueta(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def texto_prometheus():
+    metricas = [
+        ("redcoes_llamadas_total", "llamadas", "Llamadas o etapas medidas"),
+        ("redcoes_segundos_total", "segundos", "Segundos acumulados"),
+        ("redcoes_bytes_total", "bytes", "Bytes recibidos de las APIs"),
+        ("redcoes_cache_aciertos_total", "aciertos", "Aciertos de caché"),
+        ("redcoes_cache_fallos_total", "fallos", "Fallos de caché"),
+        ("redcoes_errores_total", "errores", "Llamadas o etapas que terminaron en error"),
+    ]
+    datos = sorted(totales().items())
+    lineas = []
+    for metrica, campo, ayuda in metricas:
+        lineas.append(f"# HELP {metrica} {ayuda}")
+        lineas.append(f"# TYPE {metrica} counter")
+        for (tipo, nombre), valores in datos:
+            lineas.append(f'{metrica}{{tipo="{_etiqueta(tipo)}",nombre="{_etiqueta(nombre)}"}} {valores[campo]}')
+    return "\n".join(lineas) + "\n"
+
+
+def escribir_prometheus(forzar=False):
+    # Archivo para el textfile collector de node_exporter; como mucho una
+    # escritura cada INTERVALO_ARCHIVO segundos
+    global _ultima_escritura
+    if not ARCHIVO_PROMETHEUS:
+        return
+    ahora = time.time()
+    with _lock:
+        if not forzar and ahora - _ultima_escritura < INTERVALO_ARCHIVO:
+            return
+        _ultima_escritura = ahora
+    temporal = f"{ARCHIVO_PROMETHEUS}.{threading.get_ident()}.tmp"
+    try:
+        with open(temporal, "w", encoding="utf-8") as archivo:
+            archivo.write(texto_prometheus())
+        os.replace(temporal, ARCHIVO_PROMETHEUS)
+    except OSError:
+        logger.exception("No se pudo escribir el archivo de métricas %s", ARCHIVO_PROMETHEUS)
+
+
+# PANEL
+
+def mostrar_panel():
+    if not PANEL_RENDIMIENTO:
+        return
+    import streamlit as st
+    rerun = _rerun.get()
+    with st.sidebar.expander("📊 Rendimiento"):
+        if rerun is not None and rerun["segundos"] is not None:
+            st.caption(f"Último rerun: {rerun['segundos']:.2f} s")
+            st.dataframe(resumen_por_pestana(rerun), use_container_width=True, hide_index=True)
+            with _lock:
+                lentos = sorted(
+                    (r for r in rerun["registros"] if r["tipo"] not in ("pestana", "rerun")),
+                    key=lambda r: r["segundos"], reverse=True
+                )[:15]
+            if lentos:
+                st.caption("Etapas y llamadas más lentas")
+                st.dataframe(
+                    [{k: r[k] for k in ("pestana", "tipo", "nombre", "segundos", "bytes", "cache")} for r in lentos],
+                    use_container_width=True, hide_index=True
+                )
+
+        st.caption("Acumulado del proceso")
+        filas = [
+            {"tipo": tipo, "nombre": nombre, **valores,
+             "promedio_s": valores["segundos"] / valores["llamadas"] if valores["llamadas"] else 0.0}
+            for (tipo, nombre), valores in sorted(totales().items())
+        ]
+        st.dataframe(filas, use_container_width=True, hide_index=True)
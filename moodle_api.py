@@ -0,0 +1,321 @@
+# REDCOES - Acceso a la API REST de Moodle
+
+import contextvars
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+import requests
+from requests.adapters import HTTPAdapter
+from almacen_local import COMPARTIR_PROCESOS, CacheSQLite
+from cache_ttl import CacheTTL, UnVuelo
+from metricas import medir, registrar_cache
+
+# CONFIGURACIÓN
+MOODLE_URL = os.getenv("MOODLE_URL", "https://redcoes.edu.sv/aulavirtual/webservice/rest/server.php")
+MOODLE_TOKEN = os.getenv("MOODLE_TOKEN")
+MAX_CONCURRENCIA = int(os.getenv("MOODLE_MAX_CONCURRENCIA", "8"))
+TIMEOUT_PETICION = float(os.getenv("MOODLE_TIMEOUT", "30"))
+CACHE_TTL_PARTICIPANTES = int(os.getenv("MOODLE_CACHE_TTL", "600"))
+CACHE_MAX_CURSOS = int(os.getenv("MOODLE_CACHE_MAX_CURSOS", "2000"))
+REINTENTOS = int(os.getenv("MOODLE_REINTENTOS", "3"))
+FACTOR_ESPERA = float(os.getenv("MOODLE_FACTOR_ESPERA", "0.5"))
+TAMANO_PAGINA_USUARIOS = int(os.getenv("MOODLE_TAMANO_PAGINA_USUARIOS", "500"))
+PAGINAS_VACIAS_MAX = int(os.getenv("MOODLE_PAGINAS_VACIAS_MAX", "5"))
+# Con MOODLE_CACHE_TTL=0 las matrículas no vencen; se siguen refrescando solo las
+# consultadas en este lapso (segundos)
+INTERVALO_SIN_VENCIMIENTO = 600
+# Sondeo de ids más allá de las páginas vacías: ventanas de 25 ids a 1, 2, 4...
+# páginas de distancia (hasta 2^19 páginas) en una sola llamada
+PASOS_SONDEO = 20
+TAMANO_VENTANA_SONDEO = 25
+
+logger = logging.getLogger(__name__)
+
+
+
+# ERRORES
+
+class MoodleError(Exception):
+    def __init__(self, mensaje, codigo=None, excepcion=None):
+        super().__init__(mensaje)
+        self.codigo = codigo
+        self.excepcion = excepcion
+
+
+class MoodleConexionError(MoodleError):
+    pass
+
+
+class MoodleTokenInvalido(MoodleError):
+    pass
+
+
+class MoodleAccesoDenegado(MoodleError):
+    pass
+
+
+class MoodleParametroInvalido(MoodleError):
+    pass
+
+
+# Moodle responde con HTTP 200 y un JSON {"exception", "errorcode", "message"} cuando falla
+ERRORES_MOODLE = {
+    "invalidtoken": MoodleTokenInvalido,
+    "accessexception": MoodleAccesoDenegado,
+    "nopermissions": MoodleAccesoDenegado,
+    "requireloginerror": MoodleAccesoDenegado,
+    "servicenotavailable": MoodleAccesoDenegado,
+    "invalidparameter": MoodleParametroInvalido,
+    "invalidrecord": MoodleParametroInvalido,
+}
+
+
+def error_desde_respuesta(datos):
+    codigo = datos.get("errorcode")
+    clase = ERRORES_MOODLE.get(codigo, MoodleError)
+    return clase(datos.get("message") or codigo or "Error de Moodle", codigo=codigo, excepcion=datos.get("exception"))
+
+
+# CLIENTE
+
+class MoodleCliente:
+    def __init__(self, url, token, timeout=TIMEOUT_PETICION, reintentos=REINTENTOS,
+                 factor_espera=FACTOR_ESPERA, tamano_pool=MAX_CONCURRENCIA):
+        self.url = url
+        self.token = token
+        self.timeout = timeout
+        self.reintentos = reintentos
+        self.factor_espera = factor_espera
+
+        # Sesión con conexiones keep-alive reutilizadas entre llamadas e hilos
+        self.sesion = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=max(tamano_pool, 1))
+        self.sesion.mount("https://", adaptador)
+        self.sesion.mount("http://", adaptador)
+        self.sesion.headers.update({
+            "Content-Type": "application/x-www-form-urlencoded",
+            "Accept-Encoding": "gzip, deflate",
+        })
+
+    def llamar(self, funcion, params=None, reintentos=None):
+        datos = {"wstoken": self.token, "wsfunction": funcion, "moodlewsrestformat": "json"}
+        datos.update(params or {})
+        reintentos = self.reintentos if reintentos is None else reintentos
+
+        with medir(funcion, "moodle") as medicion:
+            for intento in range(reintentos + 1):
+                try:
+                    respuesta = self.sesion.post(self.url, data=datos, timeout=self.timeout)
+                except (requests.Timeout, requests.ConnectionError) as e:
+                    error = MoodleConexionError(f"{funcion}: {e}")
+                else:
+                    medicion["bytes"] = medicion.get("bytes", 0) + len(respuesta.content)
+                    if respuesta.status_code < 500:
+                        return self._procesar(funcion, respuesta)
+                    error = MoodleConexionError(f"{funcion}: HTTP {respuesta.status_code}", codigo=str(respuesta.status_code))
+
+                # Solo se reintentan los tiempos agotados, fallos de red y errores 5xx
+                if intento < reintentos:
+                    time.sleep(self.factor_espera * 2 ** intento)
+            raise error
+
+    def _procesar(self, funcion, respuesta):
+        if respuesta.status_code >= 400:
+            raise MoodleError(f"{funcion}: HTTP {respuesta.status_code}", codigo=str(respuesta.status_code))
+        try:
+            resultado = respuesta.json()
+        except ValueError:
+            raise MoodleError(f"{funcion}: respuesta no válida de Moodle")
+        if isinstance(resultado, dict) and "exception" in resultado:
+            raise error_desde_respuesta(resultado)
+        return resultado
+
+
+def codificar_lista(nombre, elementos):
+    # [{"a": 1}, ...] -> {"nombre[0][a]": 1, ...} como lo espera la API REST de Moodle
+    datos = {}
+    for i, elemento in enumerate(elementos):
+        for k, v in elemento.items():
+            datos[f"{nombre}[{i}][{k}]"] = v
+    return datos
+
+
+# Cliente compartido por todo el proceso
+cliente = MoodleCliente(MOODLE_URL, MOODLE_TOKEN)
+
+# Matrículas por curso compartidas entre pestañas, reruns y sesiones
+cache_participantes = CacheTTL(max_entradas=CACHE_MAX_CURSOS, ttl=CACHE_TTL_PARTICIPANTES)
+# Solo la cantidad de matriculados, para las tablas resumen
+cache_conteos = CacheTTL(max_entradas=CACHE_MAX_CURSOS, ttl=CACHE_TTL_PARTICIPANTES)
+
+# Segundo nivel en SQLite para compartir las matrículas entre procesos
+compartida_participantes = CacheSQLite("cache_participantes", CACHE_TTL_PARTICIPANTES) if COMPARTIR_PROCESOS else None
+compartida_conteos = CacheSQLite("cache_conteos", CACHE_TTL_PARTICIPANTES) if COMPARTIR_PROCESOS else None
+_vuelos = UnVuelo()
+
+# Pide a Moodle solo el id de cada usuario en lugar del perfil completo
+# (campos personalizados, grupos, roles...)
+OPCIONES_SOLO_ID = {"options[0][name]": "userfields", "options[0][value]": "id"}
+
+
+# MATRÍCULAS
+
+def _desde_cache(cache, compartida, course_id):
+    valor = cache.obtener(course_id)
+    if valor is None and compartida is not None:
+        valor = compartida.obtener(course_id)
+        if valor is not None:
+            cache.guardar(course_id, valor)
+    return valor
+
+
+def _guardar_en_cache(cache, compartida, course_id, valor):
+    cache.guardar(course_id, valor)
+    if compartida is not None:
+        compartida.guardar(course_id, valor)
+
+
+def descargar_participantes(course_id):
+    # Las descargas simultáneas del mismo curso (varias sesiones, el planificador)
+    # comparten una sola llamada a Moodle
+    def descargar():
+        participantes = cliente.llamar("core_enrol_get_enrolled_users", {"courseid": course_id})
+        _guardar_en_cache(cache_participantes, compartida_participantes, course_id, participantes)
+        return participantes
+    return _vuelos.ejecutar(("participantes", int(course_id)), descargar)
+
+
+def obtener_participantes(course_id):
+    en_cache = _desde_cache(cache_participantes, compartida_participantes, course_id)
+    registrar_cache("participantes", en_cache is not None)
+    if en_cache is not None:
+        return en_cache
+    return descargar_participantes(course_id)
+
+
+def descargar_conteo(course_id):
+    def descargar():
+        matriculados = cliente.llamar("core_enrol_get_enrolled_users", {"courseid": course_id, **OPCIONES_SOLO_ID})
+        _guardar_en_cache(cache_conteos, compartida_conteos, course_id, len(matriculados))
+        return len(matriculados)
+    return _vuelos.ejecutar(("conteo", int(course_id)), descargar)
+
+
+def contar_participantes(course_id):
+    # Si las matrículas completas ya están en caché (de este proceso o compartida)
+    # no hace falta pedir nada
+    completas = _desde_cache(cache_participantes, compartida_participantes, course_id)
+    if completas is not None:
+        registrar_cache("conteo_participantes", True)
+        return len(completas)
+    conteo = _desde_cache(cache_conteos, compartida_conteos, course_id)
+    registrar_cache("conteo_participantes", conteo is not None)
+    if conteo is not None:
+        return conteo
+    return descargar_conteo(course_id)
+
+
+def contar_participantes_lote(course_ids, max_concurrencia=MAX_CONCURRENCIA):
+    # Cantidad de matriculados de varios cursos: {course_id: cantidad}, {course_id: error}.
+    # La API no tiene una función de matrículas para varios cursos a la vez; los
+    # que no están en caché se piden en paralelo.
+    return obtener_en_paralelo(contar_participantes, course_ids, max_concurrencia)
+
+
+def olvidar_matriculas(course_ids):
+    # Tras matricular usuarios: la próxima consulta de esos cursos vuelve a Moodle
+    for course_id in course_ids:
+        for cache, compartida in ((cache_participantes, compartida_participantes), (cache_conteos, compartida_conteos)):
+            cache.invalidar(course_id)
+            if compartida is not None:
+                compartida.borrar(course_id)
+
+
+def refrescar_participantes():
+    # Tarea del planificador: vuelve a descargar antes de que venzan solo los
+    # cursos vigentes que alguien consultó dentro de la vigencia de la caché; los
+    # demás se dejan vencer para que la caché (y la carga sobre Moodle) no crezca
+    # con cada curso que se abrió alguna vez
+    en_uso = CACHE_TTL_PARTICIPANTES or INTERVALO_SIN_VENCIMIENTO
+    _, errores = obtener_en_paralelo(descargar_participantes, cache_participantes.claves_en_uso(en_uso))
+    _, errores_conteo = obtener_en_paralelo(descargar_conteo, cache_conteos.claves_en_uso(en_uso))
+    fallidos = len(errores) + len(errores_conteo)
+    if fallidos:
+        raise MoodleError(f"No se pudieron actualizar {fallidos} curso(s)")
+
+
+# PETICIONES CONCURRENTES
+
+def obtener_en_paralelo(funcion, ids, max_concurrencia=MAX_CONCURRENCIA, timeout_total=None):
+    # Ejecuta funcion(id) para cada id con un máximo de hilos simultáneos.
+    # Devuelve dos diccionarios: resultados {id: valor} y errores {id: mensaje},
+    # de modo que un fallo parcial no impide mostrar el resto de los datos.
+    ids_unicos = list(dict.fromkeys(ids))
+    resultados, errores = {}, {}
+    if not ids_unicos:
+        return resultados, errores
+
+    hilos = max(1, min(max_concurrencia, len(ids_unicos)))
+    executor = ThreadPoolExecutor(max_workers=hilos)
+    try:
+        # Cada hilo hereda el contexto del rerun para que las métricas se le atribuyan
+        futuros = {executor.submit(contextvars.copy_context().run, funcion, id_): id_ for id_ in ids_unicos}
+        terminados, pendientes = wait(futuros, timeout=timeout_total)
+
+        for futuro in terminados:
+            id_ = futuros[futuro]
+            try:
+                resultados[id_] = futuro.result()
+            except Exception as e:
+                errores[id_] = str(e) or e.__class__.__name__
+
+        for futuro in pendientes:
+            futuro.cancel()
+            errores[futuros[futuro]] = "Tiempo de espera agotado"
+    finally:
+        # No bloquear la página esperando peticiones que ya se dieron por perdidas
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return resultados, errores
+
+
+# USUARIOS POR PÁGINAS
+
+def _sondear_ids(desde, tamano_pagina):
+    # Una sola llamada con ventanas cortas de ids a distancias crecientes desde
+    # `desde` (1, 2, 4... páginas). Detecta usuarios después de un hueco grande
+    # (un borrado masivo, ids que empiezan alto). Devuelve el mayor id encontrado o None.
+    ids = [desde + tamano_pagina * 2 ** k + j for k in range(PASOS_SONDEO) for j in range(TAMANO_VENTANA_SONDEO)]
+    params = {"field": "id"}
+    params.update({f"values[{i}]": uid for i, uid in enumerate(ids)})
+    usuarios = cliente.llamar("core_user_get_users_by_field", params)
+    return max((int(u["id"]) for u in usuarios), default=None)
+
+
+def iterar_usuarios(tamano_pagina=TAMANO_PAGINA_USUARIOS, paginas_vacias_max=PAGINAS_VACIAS_MAX, id_maximo=None):
+    # Recorre los usuarios por rangos de id con core_user_get_users_by_field y entrega
+    # cada página por separado, sin mantener la respuesta completa en memoria.
+    # Los ids pueden tener huecos (usuarios eliminados). La cota superior es el
+    # mayor entre id_maximo (p. ej. el de la carga anterior) y lo que encuentre un
+    # sondeo inicial; solo se termina después de pasarla, tras varias páginas vacías
+    # seguidas y un sondeo más allá que no encuentre a nadie.
+    cota = max(id_maximo or 0, _sondear_ids(1, tamano_pagina) or 0)
+    inicio = 1
+    vacias = 0
+    while True:
+        if vacias >= paginas_vacias_max and inicio > cota:
+            encontrado = _sondear_ids(inicio, tamano_pagina)
+            if encontrado is None:
+                return
+            logger.warning("Usuarios de Moodle después de un hueco de ids desde %s (hasta %s)", inicio, encontrado)
+            cota = encontrado
+        params = {"field": "id"}
+        params.update({f"values[{i}]": uid for i, uid in enumerate(range(inicio, inicio + tamano_pagina))})
+        usuarios = cliente.llamar("core_user_get_users_by_field", params)
+        inicio += tamano_pagina
+        if usuarios:
+            vacias = 0
+            yield usuarios
+        else:
+            vacias += 1
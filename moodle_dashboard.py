@@ -1,142 +1,140 @@
+import logging
 import streamlit as st
-import requests
 import pandas as pd
 from datetime import datetime
-from bs4 import BeautifulSoup
-import os
-
-def main():
-    # CONFIGURACIÓN INICIAL
-    MOODLE_URL = "https://redcoes.edu.sv/aulavirtual/webservice/rest/server.php"
-    TOKEN = os.getenv("MOODLE_TOKEN")
-    HEADERS = {"Content-Type": "application/x-www-form-urlencoded"}
+from moodle_api import (
+    cliente, contar_participantes_lote, obtener_participantes, refrescar_participantes,
+    iterar_usuarios, MoodleError
+)
+from almacen_local import actualizar, cargar_con_snapshot, obtener_guardado, solicitar_actualizacion, ultimo_guardado
+from planificador import planificador, mostrar_estado
+from normalizacion_moodle import normalizar_usuarios, CAMPOS_ACREDITACION
+from esquemas import aplicar_esquema, ErrorEsquema
+from exportacion import boton_exportar
+from tablas import tabla_paginada
+from trabajos_moodle import (
+    leer_matriculas, crear_trabajo_matriculas, crear_trabajo_clonacion, iniciar, en_ejecucion,
+    listar_trabajos, progreso, pasos_con_error, usuarios_no_encontrados, resolver_importacion,
+    TAMANO_LOTE, ROL_ESTUDIANTE
+)
+from metricas import medir, pestana, iniciar_rerun, terminar_rerun, mostrar_panel
+
+COLUMNAS_BASE_USUARIOS = {"ID": "id", "Nombre": "fullname", "Correo": "email", "Ciudad": "city", "País": "country"}
+COLUMNAS_BASE_PARTICIPANTES = {"ID": "id", "Nombre": "fullname", "Correo": "email"}
+COLUMNAS_USUARIOS = list(COLUMNAS_BASE_USUARIOS) + list(CAMPOS_ACREDITACION.values())
+ESTADOS_TRABAJO = {
+    "pendiente": "⏳ Pendiente", "en_curso": "🔄 En curso", "completado": "✅ Completado",
+    "con_errores": "⚠️ Completado con errores", "error": "❌ Error", "interrumpido": "⏸️ Interrumpido",
+}
+logger = logging.getLogger(__name__)
+# Aviso de la última carga de usuarios (también de las hechas en segundo plano)
+avisos_carga = {}
+
+MESES_ORDEN = ['Enero','Febrero','Marzo','Abril','Mayo','Junio','Julio','Agosto','Septiembre','Octubre','Noviembre','Diciembre']
+
+# UTILIDADES
+
+def construir_usuarios_df(usuarios):
+    return normalizar_usuarios(usuarios, COLUMNAS_BASE_USUARIOS)
+
+def construir_cursos_df(cursos):
+    cursos_df = aplicar_esquema(pd.DataFrame(cursos), "cursos")
+    cursos_df["Inicio"] = pd.to_datetime(cursos_df["startdate"], unit="s", errors="coerce")
+    cursos_df["Cierre"] = pd.to_datetime(cursos_df["enddate"], unit="s", errors="coerce")
+    cursos_df = cursos_df.dropna(subset=["Inicio"])
+    cursos_df["Año"] = cursos_df["Inicio"].dt.year.astype("int16")
+    cursos_df["Mes"] = cursos_df["Inicio"].dt.month.astype("int8")
+    cursos_df["MesNombre"] = pd.Categorical.from_codes(cursos_df["Mes"] - 1, categories=MESES_ORDEN)
+    return cursos_df
 
-    # FUNCIONES DE API
+# CARGADORES (sin Streamlit, también se ejecutan en hilos de fondo)
 
-    def obtener_cursos():
-        return requests.post(MOODLE_URL, data={
-            "wstoken": TOKEN, "wsfunction": "core_course_get_courses",
-            "moodlewsrestformat": "json"
-        }, headers=HEADERS).json()
-
-    def obtener_participantes(course_id):
-        return requests.post(MOODLE_URL, data={
-            "wstoken": TOKEN, "wsfunction": "core_enrol_get_enrolled_users",
-            "courseid": course_id, "moodlewsrestformat": "json"
-        }, headers=HEADERS).json()
-
-    def obtener_usuarios():
-        return requests.post(MOODLE_URL, data={
-            "wstoken": TOKEN, "wsfunction": "core_user_get_users",
-            "criteria[0][key]": "", "criteria[0][value]": "",
-            "moodlewsrestformat": "json"
-        }, headers=HEADERS).json()
-
-    def matricular_usuario(course_id, user_ids, role_id=5):
-        enrolments = [{"roleid": role_id, "userid": uid, "courseid": course_id} for uid in user_ids]
-        data = {"wstoken": TOKEN, "wsfunction": "enrol_manual_enrol_users", "moodlewsrestformat": "json"}
-        for i, e in enumerate(enrolments):
-            for k, v in e.items():
-                data[f"enrolments[{i}][{k}]"] = v
-        return requests.post(MOODLE_URL, data=data, headers=HEADERS).json()
-
-    def crear_curso(nombre, corto_nombre, categoria_id):
-        return requests.post(MOODLE_URL, data={
-            "wstoken": TOKEN, "wsfunction": "core_course_create_courses",
-            "courses[0][fullname]": nombre,
-            "courses[0][shortname]": corto_nombre,
-            "courses[0][categoryid]": categoria_id,
-            "moodlewsrestformat": "json"
-        }, headers=HEADERS).json()
-
-    def importar_contenido_curso(source_course_id, target_course_id):
-        return requests.post(MOODLE_URL, data={
-            "wstoken": TOKEN, "wsfunction": "core_course_import_course",
-            "importfrom": source_course_id,
-            "importto": target_course_id,
-            "moodlewsrestformat": "json"
-        }, headers=HEADERS).json()
-
-    # UTILIDADES
-
-    def extraer_campo(usr, shortname):
-        for campo in usr.get("customfields", []):
-            if campo.get("shortname") == shortname:
-                return campo.get("value")
+def cargar_cursos():
+    cursos = cliente.llamar("core_course_get_courses")
+    if not isinstance(cursos, list) or not cursos:
+        raise MoodleError("Moodle no devolvió cursos")
+    with medir("construir_cursos_df"):
+        return construir_cursos_df(cursos)
+
+def id_maximo_conocido():
+    # Mayor id de la última carga de usuarios: la siguiente no termina antes de pasarlo
+    guardado = ultimo_guardado("usuarios")
+    if guardado is None or guardado[0].empty:
         return None
+    return int(guardado[0]["ID"].max())
+
+def aviso_carga_incompleta(usuarios_df, id_maximo):
+    # La carga terminó antes del mayor id de la carga anterior
+    maximo = int(usuarios_df["ID"].max()) if not usuarios_df.empty else 0
+    if id_maximo and maximo < id_maximo:
+        return (f"La carga de usuarios llegó hasta el id {maximo}, pero la anterior llegaba hasta {id_maximo}: "
+                "puede haber usuarios que no se cargaron.")
+    return None
+
+def registrar_aviso(usuarios_df, id_maximo):
+    aviso = aviso_carga_incompleta(usuarios_df, id_maximo)
+    if aviso:
+        logger.warning(aviso)
+        avisos_carga["usuarios"] = aviso
+    else:
+        avisos_carga.pop("usuarios", None)
+
+def cargar_usuarios():
+    id_maximo = id_maximo_conocido()
+    bloques = [construir_usuarios_df(usuarios) for usuarios in iterar_usuarios(id_maximo=id_maximo)]
+    usuarios_df = pd.concat(bloques, ignore_index=True) if bloques else pd.DataFrame(columns=COLUMNAS_USUARIOS)
+    registrar_aviso(usuarios_df, id_maximo)
+    return usuarios_df
 
-    def limpiar_html(texto):
-        if texto:
-            return BeautifulSoup(texto, "html.parser").get_text(strip=True)
-        return None
+def main():
+    # FUNCIONES DE API
+
+    def conteo_por_curso(course_ids):
+        # Solo la cantidad de matriculados de cada curso, pedida para todos a la vez
+        resultados, errores = contar_participantes_lote(course_ids)
+        if errores:
+            st.warning(f"⚠️ No se pudieron cargar los participantes de {len(errores)} curso(s): "
+                       + ", ".join(str(cid) for cid in errores))
+        return resultados
 
     # DASHBOARD
     st.title("🎓 Dashboard de Moodle")
 
     # CARGA DE DATOS
-    if "cursos" not in st.session_state or st.session_state.get("refrescar"):
-        st.session_state["cursos"] = obtener_cursos()
-
-    if "usuarios" not in st.session_state or st.session_state.get("refrescar"):
-        st.session_state["usuarios"] = obtener_usuarios()
+    # Las matrículas en caché se renuevan en segundo plano antes de vencer
+    planificador.programar("participantes", refrescar_participantes)
 
-    # Asignar a variables locales
-    cursos = st.session_state["cursos"]
-    usuarios = st.session_state["usuarios"]
+    # Refrescar no bloquea: se siguen mostrando los datos actuales mientras se actualizan
+    if st.session_state.get("refrescar"):
+        solicitar_actualizacion("cursos", "usuarios", "participantes")
 
-    if not isinstance(cursos, list) or not cursos:
-        st.error("❌ No se pudieron cargar los cursos desde Moodle.")
+    try:
+        cursos_df = cargar_con_snapshot("cursos", cargar_cursos)[0]
+    except (MoodleError, ErrorEsquema) as e:
+        st.error(f"❌ No se pudieron cargar los cursos desde Moodle: {e}")
         st.stop()
 
-    # DataFrame de cursos
-    cursos_df = pd.DataFrame(cursos)
-    cursos_df["Inicio"] = pd.to_datetime(cursos_df["startdate"], unit="s", errors="coerce")
-    cursos_df["Cierre"] = pd.to_datetime(cursos_df["enddate"], unit="s", errors="coerce")
-    cursos_df = cursos_df.dropna(subset=["Inicio"])
-    cursos_df["Año"] = cursos_df["Inicio"].dt.year
-    cursos_df["Mes"] = cursos_df["Inicio"].dt.month
-    meses_orden = ['Enero','Febrero','Marzo','Abril','Mayo','Junio','Julio','Agosto','Septiembre','Octubre','Noviembre','Diciembre']
-    cursos_df["MesNombre"] = cursos_df["Inicio"].dt.month.map(lambda m: meses_orden[m - 1])
-
-    # DataFrame de usuarios
-    usuarios_df = pd.DataFrame([{
-        "ID": u.get("id"),
-        "Nombre": u.get("fullname"),
-        "Correo": u.get("email"),
-        "Ciudad": u.get("city"),
-        "País": u.get("country"),
-        "Nombres acreditación": extraer_campo(u, "nombrescvpcpa"),
-        "Apellidos acreditación": extraer_campo(u, "apellidoscvpcpa"),
-        "Tipo acreditación": extraer_campo(u, "tipoinscripcion"),
-        "Número acreditación": limpiar_html(extraer_campo(u, "numero"))
-    } for u in usuarios.get("users", [])])
-
-    # TABS
-    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
-        "📆 Cursos en Ejecución", 
-        "🟡 Cursos por Iniciar",
-        "📁 Cursos Finalizados (últimos 25)",
-        "📚 Participantes de cursos", 
-        "📊 Estadísticas Globales", 
-        "👥 Usuarios (Global)"
-    ])
+    # SECCIONES
+    # A diferencia de st.tabs, solo se ejecuta la sección visible: cada una pide sus
+    # datos al mostrarse y reutiliza las cachés (cursos, matrículas, usuarios) después
 
     # TAB 1: Cursos en ejecución
-    with tab1:
+    def seccion_en_ejecucion():
         st.header("📆 Cursos en Ejecución")
         ahora = datetime.now().timestamp()
         en_ejecucion = cursos_df[(cursos_df["startdate"] <= ahora) & (cursos_df["enddate"] > ahora)]
 
         if not en_ejecucion.empty:
             cursos_activos = []
+            conteos_cursos = conteo_por_curso(en_ejecucion["id"].tolist())
             for _, curso in en_ejecucion.iterrows():
-                participantes = obtener_participantes(curso["id"])
+                participantes = conteos_cursos.get(curso["id"], 0)
                 cursos_activos.append({
                     "ID": curso["id"],
                     "Nombre del Curso": curso["fullname"],
                     "Fecha de Inicio": datetime.fromtimestamp(curso["startdate"]).strftime("%d/%m/%Y"),
                     "Fecha de Finalización": datetime.fromtimestamp(curso["enddate"]).strftime("%d/%m/%Y"),
-                    "Cantidad de Participantes": len(participantes)
+                    "Cantidad de Participantes": participantes
                 })
 
             df_ejecucion = pd.DataFrame(cursos_activos).sort_values(by="ID", ascending=False)
@@ -146,42 +144,44 @@ def main():
             st.info("No hay cursos en ejecución actualmente.")
 
     # TAB 2: Cursos por iniciar
-    with tab2:
+    def seccion_por_iniciar():
         st.header("🟡 Cursos por Iniciar")
         ahora = datetime.now().timestamp()
         por_iniciar = cursos_df[cursos_df["startdate"] > ahora]
 
         if not por_iniciar.empty:
             cursos_futuros = []
+            conteos_cursos = conteo_por_curso(por_iniciar["id"].tolist())
             for _, curso in por_iniciar.iterrows():
-                participantes = obtener_participantes(curso["id"])
+                participantes = conteos_cursos.get(curso["id"], 0)
                 cursos_futuros.append({
                     "ID": curso["id"],
                     "Nombre del Curso": curso["fullname"],
                     "Fecha de Inicio": datetime.fromtimestamp(curso["startdate"]).strftime("%d/%m/%Y"),
                     "Fecha de Finalización": datetime.fromtimestamp(curso["enddate"]).strftime("%d/%m/%Y"),
-                    "Cantidad de Participantes": len(participantes)
+                    "Cantidad de Participantes": participantes
                 })
             st.dataframe(pd.DataFrame(cursos_futuros).sort_values(by="ID", ascending=False), use_container_width=True)
         else:
             st.info("No hay cursos próximos a iniciar.")
 
     # TAB 3: Cursos Finalizados (últimos 25)
-    with tab3:
+    def seccion_finalizados():
         st.header("📁 Cursos Finalizados (últimos 25)")
         ahora = datetime.now().timestamp()
         finalizados = cursos_df[cursos_df["enddate"] < ahora].sort_values(by="id", ascending=False).head(25)
 
         if not finalizados.empty:
             cursos_finalizados = []
+            conteos_cursos = conteo_por_curso(finalizados["id"].tolist())
             for _, curso in finalizados.iterrows():
-                participantes = obtener_participantes(curso["id"])
+                participantes = conteos_cursos.get(curso["id"], 0)
                 cursos_finalizados.append({
                     "ID": curso["id"],
                     "Nombre del Curso": curso["fullname"],
                     "Fecha de Inicio": datetime.fromtimestamp(curso["startdate"]).strftime("%d/%m/%Y"),
                     "Fecha de Finalización": datetime.fromtimestamp(curso["enddate"]).strftime("%d/%m/%Y"),
-                    "Cantidad de Participantes": len(participantes)
+                    "Cantidad de Participantes": participantes
                 })
 
             df_finalizados = pd.DataFrame(cursos_finalizados)
@@ -190,7 +190,7 @@ def main():
             st.info("No hay cursos finalizados.")
 
     # TAB 4: Participantes de cursos
-    with tab4:
+    def seccion_participantes():
         st.header("📚 Lista de Cursos")
 
         cursos_ordenados = cursos_df.sort_values(by="id", ascending=False)
@@ -199,39 +199,35 @@ def main():
         st.write(f"ID del curso seleccionado: {curso_id}")
 
         st.subheader("👨‍🏫 Participantes del Curso")
-        participantes = obtener_participantes(curso_id)
-        datos_participantes = [{
-            "ID": p.get("id"),
-            "Nombre": p.get("fullname"),
-            "Correo": p.get("email"),
-            "Nombres acreditación": extraer_campo(p, "nombrescvpcpa"),
-            "Apellidos acreditación": extraer_campo(p, "apellidoscvpcpa"),
-            "Tipo acreditación": extraer_campo(p, "tipoinscripcion"),
-            "Número acreditación": limpiar_html(extraer_campo(p, "numero"))
-        } for p in participantes]
-
-        if datos_participantes:
-            df_participantes = pd.DataFrame(datos_participantes)
+        try:
+            participantes = obtener_participantes(curso_id)
+        except MoodleError as e:
+            st.error(f"❌ No se pudieron cargar los participantes: {e}")
+            participantes = []
+        with medir("normalizar_participantes"):
+            df_participantes = normalizar_usuarios(participantes, COLUMNAS_BASE_PARTICIPANTES)
+
+        if not df_participantes.empty:
             st.dataframe(df_participantes, use_container_width=True)
+            # La lista de la caché forma parte de la firma: si una actualización trae otra
+            # lista con cambios, el archivo preparado se descarta
+            boton_exportar(lambda: df_participantes, f"participantes_curso_{curso_id}", "participantes",
+                           hoja="Participantes", firma=(int(curso_id), participantes))
         else:
             st.info("Este curso no tiene participantes inscritos aún.")
 
     # TAB 5: Estadísticas globales
-    with tab5:
+    def seccion_estadisticas():
         st.header("📊 Estadísticas Globales")
 
-        # Orden real de los meses (nombres)
-        meses_orden = ['Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio',
-                    'Julio', 'Agosto', 'Septiembre', 'Octubre', 'Noviembre', 'Diciembre']
-
         # Selectores
         anios = sorted(cursos_df["Año"].dropna().unique(), reverse=True)
         anio_sel = st.selectbox("Año", anios)
-        mes_desde = st.selectbox("Mes desde", meses_orden, index=0)
-        mes_hasta = st.selectbox("Mes hasta", meses_orden, index=11)
+        mes_desde = st.selectbox("Mes desde", MESES_ORDEN, index=0)
+        mes_hasta = st.selectbox("Mes hasta", MESES_ORDEN, index=11)
 
-        idx_inicio = meses_orden.index(mes_desde) + 1
-        idx_fin = meses_orden.index(mes_hasta) + 1
+        idx_inicio = MESES_ORDEN.index(mes_desde) + 1
+        idx_fin = MESES_ORDEN.index(mes_hasta) + 1
 
         # Filtro de cursos
         df_filtrado = cursos_df[
@@ -241,7 +237,8 @@ def main():
 
         if not df_filtrado.empty:
             # Obtener cantidad de participantes por curso
-            df_filtrado["participantes"] = df_filtrado["id"].apply(lambda cid: len(obtener_participantes(cid)))
+            conteos_cursos = conteo_por_curso(df_filtrado["id"].tolist())
+            df_filtrado["participantes"] = df_filtrado["id"].map(lambda cid: conteos_cursos.get(cid, 0))
 
             # Agrupar por número de mes
             resumen_cursos = df_filtrado.groupby("Mes", observed=True).size().reindex(range(1,13), fill_value=0)
@@ -256,10 +253,191 @@ def main():
             st.warning("No hay cursos en el periodo seleccionado.")
 
     # TAB 6: Usuarios
-    with tab6:
+    def seccion_usuarios():
         st.header("👥 Usuarios creados en Moodle")
-        st.dataframe(usuarios_df, use_container_width=True)
+
+        guardado = obtener_guardado("usuarios", cargar_usuarios)
+        if guardado is not None:
+            usuarios_df, marca = guardado
+            tabla_paginada(usuarios_df, "tabla_usuarios", columnas_busqueda=["Nombre", "Correo", "Número acreditación"],
+                           orden_inicial=("ID", False))
+        else:
+            # Carga por páginas: la primera página se muestra mientras llega el resto.
+            # Si otra sesión ya está cargando los usuarios, se espera a esa misma carga.
+            progreso = st.empty()
+            tabla = st.empty()
+            progreso.caption("⏳ Cargando usuarios...")
+            bloques = []
+
+            def cargar_mostrando_avance():
+                id_maximo = id_maximo_conocido()
+                for usuarios in iterar_usuarios(id_maximo=id_maximo):
+                    bloques.append(construir_usuarios_df(usuarios))
+                    if len(bloques) == 1:
+                        tabla.dataframe(bloques[0].head(100), use_container_width=True)
+                    progreso.caption(f"⏳ Cargando usuarios... {sum(len(b) for b in bloques)} hasta ahora")
+                usuarios_df = pd.concat(bloques, ignore_index=True) if bloques else pd.DataFrame(columns=COLUMNAS_USUARIOS)
+                registrar_aviso(usuarios_df, id_maximo)
+                return usuarios_df
+
+            error_carga = None
+            try:
+                usuarios_df, marca = actualizar("usuarios", cargar_mostrando_avance)
+            except MoodleError as e:
+                # Se muestra lo que alcanzó a llegar, pero no se guarda
+                error_carga = e
+                marca = None
+                usuarios_df = pd.concat(bloques, ignore_index=True) if bloques else pd.DataFrame(columns=COLUMNAS_USUARIOS)
+
+            progreso.empty()
+            tabla.empty()
+            tabla_paginada(usuarios_df, "tabla_usuarios", columnas_busqueda=["Nombre", "Correo", "Número acreditación"],
+                           orden_inicial=("ID", False))
+
+            if error_carga:
+                st.error(f"❌ La carga de usuarios se interrumpió: {error_carga}")
+
+        if avisos_carga.get("usuarios"):
+            st.warning(f"⚠️ {avisos_carga['usuarios']}")
+
+        if not usuarios_df.empty:
+            boton_exportar(lambda: usuarios_df, "usuarios_moodle", "usuarios", hoja="Usuarios",
+                           firma=(marca, len(usuarios_df)))
+
+    # TAB 7: Matrículas masivas y clonación de cursos
+    # Los trabajos corren en segundo plano por lotes y quedan registrados en la base
+    # local: se puede cambiar de sección o recargar la página sin perder el avance
+    def seccion_trabajos():
+        st.header("🧩 Matrículas masivas")
+        st.caption("El CSV necesita una columna de usuario (`userid`, `email` o `username`) y, para matricular en "
+                   "cursos existentes, otra de curso (`course_id`). La columna `roleid` es opcional.")
+
+        clonar = st.radio("Tipo de trabajo", ["Matricular en cursos existentes", "Clonar un curso y matricular"],
+                          horizontal=True, key="trabajo_tipo") != "Matricular en cursos existentes"
+        nombres_cursos = cursos_df.set_index("id")["fullname"]
+
+        with st.form("form_trabajo"):
+            archivo = st.file_uploader("Archivo CSV", type=["csv"], key="trabajo_csv")
+            if clonar:
+                origen = st.selectbox("Curso de origen", cursos_df.sort_values("id", ascending=False)["id"].tolist(),
+                                      format_func=lambda cid: f"{cid} - {nombres_cursos[cid]}")
+                col_nombre, col_corto = st.columns(2)
+                nombre = col_nombre.text_input("Nombre del curso nuevo")
+                nombre_corto = col_corto.text_input("Nombre corto")
+                col_categoria, col_importar = st.columns(2)
+                categoria = col_categoria.number_input("ID de categoría (0 = la del curso de origen)", min_value=0, step=1)
+                importar = col_importar.checkbox("Importar el contenido del curso de origen", value=True)
+            col_rol, col_lote = st.columns(2)
+            rol = col_rol.number_input("Rol si el CSV no lo indica (5 = estudiante)", min_value=1,
+                                       value=ROL_ESTUDIANTE, step=1)
+            tamano_lote = col_lote.number_input("Matrículas por lote", min_value=1, max_value=1000,
+                                                value=TAMANO_LOTE, step=1)
+            enviado = st.form_submit_button("🚀 Iniciar trabajo")
+
+        if enviado:
+            try:
+                filas, descartadas = None, 0
+                if archivo is not None:
+                    filas, descartadas = leer_matriculas(archivo, int(rol), con_curso=not clonar)
+                if clonar:
+                    if not nombre.strip() or not nombre_corto.strip():
+                        raise ValueError("Indica el nombre y el nombre corto del curso nuevo")
+                    if not categoria and "categoryid" in cursos_df:
+                        categoria = cursos_df.loc[cursos_df["id"] == origen, "categoryid"].iloc[0]
+                    trabajo_id = crear_trabajo_clonacion(origen, nombre.strip(), nombre_corto.strip(), int(categoria),
+                                                         filas, importar, int(tamano_lote))
+                else:
+                    if filas is None:
+                        raise ValueError("Sube el archivo CSV con las matrículas")
+                    trabajo_id = crear_trabajo_matriculas(filas, int(tamano_lote))
+            except ValueError as e:
+                st.error(f"❌ {e}")
+            else:
+                if descartadas:
+                    st.warning(f"⚠️ {descartadas} fila(s) sin usuario o curso válido no se incluyeron.")
+                iniciar(trabajo_id)
+                st.session_state["trabajo_seleccionado"] = trabajo_id
+                st.success(f"✅ Trabajo {trabajo_id} iniciado.")
+
+        st.subheader("📋 Trabajos recientes")
+        trabajos = listar_trabajos()
+        if trabajos.empty:
+            st.info("Todavía no hay trabajos.")
+            return
+        st.button("🔄 Actualizar avance", key="trabajos_actualizar")
+        st.dataframe(trabajos.assign(estado=trabajos["estado"].map(ESTADOS_TRABAJO)), use_container_width=True,
+                     hide_index=True)
+
+        if st.session_state.get("trabajo_seleccionado") not in trabajos["id"].tolist():
+            st.session_state.pop("trabajo_seleccionado", None)
+        trabajo_id = st.selectbox("Detalle del trabajo", trabajos["id"].tolist(), key="trabajo_seleccionado",
+                                  format_func=lambda tid: f"{tid} - {trabajos.set_index('id').at[tid, 'descripcion']}")
+        avance = progreso(trabajo_id)
+        st.progress(avance["completados"] / avance["pasos"] if avance["pasos"] else 1.0,
+                    text=f"{ESTADOS_TRABAJO[avance['estado']]} · {avance['completados']} de {avance['pasos']} pasos")
+        if avance["error"]:
+            st.error(f"❌ {avance['error']}")
+
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Matriculados", avance["matriculados"])
+        col2.metric("Usuarios no encontrados", avance["no_encontrados"])
+        col3.metric("Pasos con error", avance["errores"])
+        col4.metric("Curso creado", avance["course_id"] or "—")
+
+        if not en_ejecucion(trabajo_id) and avance["estado"] in ("pendiente", "interrumpido", "error", "con_errores"):
+            col_reanudar, col_reintentar = st.columns(2)
+            reanudable = avance["estado"] in ("pendiente", "interrumpido", "error")
+            if reanudable and col_reanudar.button("▶️ Reanudar", key="trabajo_reanudar"):
+                iniciar(trabajo_id)
+                st.info("Trabajo reanudado; pulsa \"Actualizar avance\" para ver el progreso.")
+            if avance["errores"] and col_reintentar.button("🔁 Reintentar pasos con error", key="trabajo_reintentar"):
+                iniciar(trabajo_id, reintentar_fallidos=True)
+                st.info("Reintentando los pasos con error; pulsa \"Actualizar avance\" para ver el progreso.")
+
+        fallidos = pasos_con_error(trabajo_id)
+        if not fallidos.empty:
+            st.subheader("⚠️ Pasos con error")
+            st.dataframe(fallidos, use_container_width=True, hide_index=True)
+
+        # Una importación cortada no se repite sola: el usuario revisa el curso y decide
+        for numero in ([] if fallidos.empty else fallidos.loc[fallidos["revisar"], "paso"].tolist()):
+            st.warning(f"⚠️ La importación de contenido (paso {numero}) se cortó y pudo completarse en Moodle. "
+                       f"Revisa el curso {avance['course_id']} antes de continuar.")
+            col_hecha, col_repetir = st.columns(2)
+            if col_hecha.button("✅ El contenido ya está en el curso", key=f"trabajo_importada_{numero}"):
+                resolver_importacion(trabajo_id, numero, ya_importada=True)
+                iniciar(trabajo_id)
+                st.info("Paso marcado como completado; el trabajo continúa con las matrículas.")
+            if col_repetir.button("🔁 Importar de nuevo", key=f"trabajo_reimportar_{numero}"):
+                resolver_importacion(trabajo_id, numero, ya_importada=False)
+                iniciar(trabajo_id)
+                st.info("Reimportando el contenido; pulsa \"Actualizar avance\" para ver el progreso.")
+
+        no_encontrados = usuarios_no_encontrados(trabajo_id)
+        if not no_encontrados.empty:
+            st.subheader("🔎 Usuarios no encontrados en Moodle")
+            st.dataframe(no_encontrados, use_container_width=True, hide_index=True)
+            boton_exportar(lambda: no_encontrados, f"no_encontrados_trabajo_{trabajo_id}", "no_encontrados",
+                           hoja="No encontrados", firma=(trabajo_id, len(no_encontrados)))
+
+    secciones = {
+        "📆 Cursos en Ejecución": seccion_en_ejecucion,
+        "🟡 Cursos por Iniciar": seccion_por_iniciar,
+        "📁 Cursos Finalizados (últimos 25)": seccion_finalizados,
+        "📚 Participantes de cursos": seccion_participantes,
+        "📊 Estadísticas Globales": seccion_estadisticas,
+        "👥 Usuarios (Global)": seccion_usuarios,
+        "🧩 Matrículas masivas": seccion_trabajos,
+    }
+    seccion = st.radio("Sección", list(secciones), horizontal=True, key="seccion_moodle", label_visibility="collapsed")
+    with pestana(seccion):
+        secciones[seccion]()
+
+    mostrar_estado(["cursos", "usuarios", "participantes"])
 
 if __name__ == "__main__":
+    iniciar_rerun("Moodle")
     main()
     st.session_state["refrescar"] = False
+    terminar_rerun()
+    mostrar_panel()
@@ -0,0 +1,60 @@
+# REDCOES - Normalización de usuarios de Moodle a columnas de acreditación
+
+import re
+from functools import lru_cache
+from html import unescape
+import pandas as pd
+
+# shortname del campo personalizado -> columna del dashboard
+CAMPOS_ACREDITACION = {
+    "nombrescvpcpa": "Nombres acreditación",
+    "apellidoscvpcpa": "Apellidos acreditación",
+    "tipoinscripcion": "Tipo acreditación",
+    "numero": "Número acreditación",
+}
+CAMPOS_HTML = {"numero"}
+
+_ETIQUETA = re.compile(r"<[^<>]*>")
+# Comentarios, scripts, estilos o CDATA requieren el parser completo
+_HTML_COMPLEJO = re.compile(r"<\s*(?:script|style)\b|<!--|<!\[CDATA\[", re.IGNORECASE)
+
+
+@lru_cache(maxsize=65536)
+def limpiar_html(texto):
+    # Equivale a BeautifulSoup(texto, "html.parser").get_text(strip=True), pero sin
+    # construir el árbol en el caso habitual de etiquetas simples o texto plano
+    if not texto:
+        return None
+    if "<" not in texto and "&" not in texto:
+        return texto.strip()
+    if _HTML_COMPLEJO.search(texto) or texto.count("<") != texto.count(">"):
+        # Caso raro: bs4 solo se importa cuando hace falta
+        from bs4 import BeautifulSoup
+        return BeautifulSoup(texto, "html.parser").get_text(strip=True)
+    return "".join(unescape(fragmento).strip() for fragmento in _ETIQUETA.split(texto))
+
+
+def normalizar_usuarios(usuarios, columnas_base):
+    # Convierte una lista de usuarios de Moodle en un DataFrame en una sola pasada.
+    # columnas_base: {columna: clave del usuario}, p. ej. {"Correo": "email"}
+    columnas = {col: [] for col in columnas_base}
+    acreditacion = {shortname: [] for shortname in CAMPOS_ACREDITACION}
+
+    for u in usuarios:
+        for col, clave in columnas_base.items():
+            columnas[col].append(u.get(clave))
+
+        # Se recorre customfields una sola vez; gana la primera aparición de cada campo
+        encontrados = {}
+        for campo in u.get("customfields") or ():
+            shortname = campo.get("shortname")
+            if shortname in acreditacion and shortname not in encontrados:
+                encontrados[shortname] = campo.get("value")
+
+        for shortname, valores in acreditacion.items():
+            valor = encontrados.get(shortname)
+            valores.append(limpiar_html(valor) if shortname in CAMPOS_HTML else valor)
+
+    for shortname, valores in acreditacion.items():
+        columnas[CAMPOS_ACREDITACION[shortname]] = valores
+    return pd.DataFrame(columnas)
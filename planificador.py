@@ -0,0 +1,158 @@
+# REDCOES - Actualización periódica de datos en segundo plano
+
+import logging
+import os
+import threading
+import time
+from metricas import medir
+
+# Segundos entre actualizaciones de cada dataset
+INTERVALOS = {
+    "cursos": 900,
+    "usuarios": 3600,
+    "participantes": 300,
+    "pedidos": 300,
+    "productos": 3600,
+    "miembros": 1800,
+}
+INTERVALOS.update({
+    nombre: int(os.environ[f"REDCOES_INTERVALO_{nombre.upper()}"])
+    for nombre in INTERVALOS if f"REDCOES_INTERVALO_{nombre.upper()}" in os.environ
+})
+INTERVALO_POR_DEFECTO = 900
+REVISION_SEGUNDOS = 10
+
+logger = logging.getLogger(__name__)
+
+
+class Planificador:
+    # Cada tarea se ejecuta en su propio hilo cuando vence su intervalo. Mientras
+    # tanto se siguen sirviendo los últimos datos buenos (stale-while-revalidate):
+    # la tarea solo reemplaza los datos cuando termina bien.
+    def __init__(self):
+        self._tareas = {}
+        self._lock = threading.Lock()
+        self._despertar = threading.Event()
+        self._hilo = None
+
+    def programar(self, nombre, funcion, ultima=None):
+        # Idempotente: se llama en cada rerun y solo actualiza la función de carga.
+        # ultima es la marca de tiempo de los datos que se están sirviendo.
+        with self._lock:
+            tarea = self._tareas.get(nombre)
+            if tarea is None:
+                intervalo = INTERVALOS.get(nombre, INTERVALO_POR_DEFECTO)
+                ultima = ultima if ultima is not None else time.time()
+                self._tareas[nombre] = {
+                    "funcion": funcion,
+                    "intervalo": intervalo,
+                    "ultima": ultima,
+                    "proxima": ultima + intervalo,
+                    "en_curso": False,
+                    "error": None,
+                }
+            else:
+                tarea["funcion"] = funcion
+                return
+        self._iniciar()
+        # Una tarea nueva puede estar vencida (p. ej. un snapshot antiguo)
+        self._despertar.set()
+
+    def marcar_actualizado(self, nombre, cuando=None):
+        # Para datos que se cargaron en primer plano fuera del planificador
+        with self._lock:
+            tarea = self._tareas.get(nombre)
+            if tarea is not None:
+                tarea["ultima"] = cuando or time.time()
+                tarea["proxima"] = tarea["ultima"] + tarea["intervalo"]
+
+    def solicitar(self, *nombres):
+        # Adelanta la próxima actualización sin esperar al intervalo
+        with self._lock:
+            for nombre in nombres or list(self._tareas):
+                if nombre in self._tareas:
+                    self._tareas[nombre]["proxima"] = 0
+        self._despertar.set()
+
+    def estado(self):
+        with self._lock:
+            return {nombre: {k: v for k, v in tarea.items() if k != "funcion"} for nombre, tarea in self._tareas.items()}
+
+    def en_curso(self):
+        with self._lock:
+            return {nombre for nombre, tarea in self._tareas.items() if tarea["en_curso"]}
+
+    def _iniciar(self):
+        with self._lock:
+            if self._hilo is not None:
+                return
+            self._hilo = threading.Thread(target=self._bucle, name="planificador-redcoes", daemon=True)
+        self._hilo.start()
+
+    def _bucle(self):
+        while True:
+            self._despertar.wait(REVISION_SEGUNDOS)
+            self._despertar.clear()
+            ahora = time.time()
+            with self._lock:
+                vencidas = [
+                    nombre for nombre, tarea in self._tareas.items()
+                    if not tarea["en_curso"] and ahora >= tarea["proxima"]
+                ]
+                for nombre in vencidas:
+                    self._tareas[nombre]["en_curso"] = True
+            for nombre in vencidas:
+                threading.Thread(target=self._ejecutar, args=(nombre,), name=f"actualizar-{nombre}", daemon=True).start()
+
+    def _ejecutar(self, nombre):
+        with self._lock:
+            funcion = self._tareas[nombre]["funcion"]
+        error = None
+        try:
+            with medir(nombre, "segundo_plano"):
+                funcion()
+        except Exception as e:
+            logger.exception("Falló la actualización en segundo plano de '%s'", nombre)
+            error = str(e) or e.__class__.__name__
+        with self._lock:
+            tarea = self._tareas[nombre]
+            tarea["en_curso"] = False
+            tarea["error"] = error
+            if error is None:
+                tarea["ultima"] = time.time()
+                tarea["proxima"] = tarea["ultima"] + tarea["intervalo"]
+            else:
+                # Reintentar pronto, pero sin saturar el servidor
+                tarea["proxima"] = time.time() + min(60, tarea["intervalo"])
+
+
+# Planificador compartido por todo el proceso
+planificador = Planificador()
+
+
+def _antiguedad(segundos):
+    if segundos < 60:
+        return "hace segundos"
+    if segundos < 3600:
+        return f"hace {int(segundos // 60)} min"
+    return f"hace {segundos / 3600:.1f} h"
+
+
+def mostrar_estado(nombres):
+    # streamlit solo hace falta para dibujar; el planificador corre sin él
+    import streamlit as st
+    estado = planificador.estado()
+    lineas = []
+    for nombre in nombres:
+        tarea = estado.get(nombre)
+        if tarea is None:
+            continue
+        linea = f"**{nombre}**: {_antiguedad(time.time() - tarea['ultima'])}"
+        if tarea["en_curso"]:
+            linea += " · 🔄 actualizando"
+        elif tarea["error"]:
+            linea += " · ⚠️ último intento falló"
+        lineas.append(linea)
+    if lineas:
+        st.sidebar.caption("🕒 Antigüedad de los datos")
+        st.sidebar.markdown("  \n".join(lineas))
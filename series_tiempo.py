@@ -0,0 +1,70 @@
+# REDCOES - Preparación de series de tiempo para gráficos
+
+import os
+import numpy as np
+
+MAX_PUNTOS = int(os.getenv("REDCOES_GRAFICO_MAX_PUNTOS", "500"))
+
+# (días máximos del rango, frecuencia de pandas, nombre para el título)
+AGRUPACIONES = [
+    (92, "D", "día"),
+    (731, "W-MON", "semana"),
+    (None, "MS", "mes"),
+]
+
+
+def elegir_agrupacion(inicio, fin):
+    dias = (fin - inicio).days
+    for limite, frecuencia, nombre in AGRUPACIONES:
+        if limite is None or dias <= limite:
+            return frecuencia, nombre
+
+
+def lttb(x, y, puntos):
+    # Largest-Triangle-Three-Buckets: índices de los puntos que conservan la forma
+    # de la serie. x e y son arreglos numéricos ordenados por x.
+    n = len(x)
+    if puntos >= n or puntos < 3:
+        return np.arange(n)
+
+    tamano = (n - 2) / (puntos - 2)
+    elegidos = np.empty(puntos, dtype=np.int64)
+    elegidos[0], elegidos[-1] = 0, n - 1
+    a = 0
+    for i in range(puntos - 2):
+        # Promedio del siguiente cubo
+        sig_inicio = int(np.floor((i + 1) * tamano)) + 1
+        sig_fin = min(int(np.floor((i + 2) * tamano)) + 1, n)
+        prom_x = x[sig_inicio:sig_fin].mean()
+        prom_y = y[sig_inicio:sig_fin].mean()
+
+        # Punto del cubo actual que forma el triángulo de mayor área
+        inicio = int(np.floor(i * tamano)) + 1
+        fin = int(np.floor((i + 1) * tamano)) + 1
+        areas = np.abs((x[a] - prom_x) * (y[inicio:fin] - y[a]) - (x[a] - x[inicio:fin]) * (prom_y - y[a]))
+        a = inicio + int(np.argmax(areas))
+        elegidos[i + 1] = a
+    return elegidos
+
+
+def preparar_serie(df, columna_fecha, columna_valor, max_puntos=MAX_PUNTOS):
+    # Agrupa por día/semana/mes según el rango de fechas y, si aún quedan demasiados
+    # puntos, reduce con LTTB. Devuelve (DataFrame, nombre de la agrupación).
+    serie = df[[columna_fecha, columna_valor]].dropna(subset=[columna_fecha])
+    if serie.empty:
+        return serie, None
+
+    fechas = serie[columna_fecha]
+    frecuencia, nombre = elegir_agrupacion(fechas.min(), fechas.max())
+    agrupada = (
+        serie.set_index(columna_fecha)[columna_valor]
+        .resample(frecuencia, label="left", closed="left")
+        .sum()
+        .reset_index()
+    )
+
+    if len(agrupada) > max_puntos:
+        x = agrupada[columna_fecha].to_numpy(dtype="datetime64[ns]").astype(np.int64).astype(float)
+        y = agrupada[columna_valor].to_numpy(dtype=float)
+        agrupada = agrupada.iloc[lttb(x, y, max_puntos)].reset_index(drop=True)
+    return agrupada, nombre
@@ -0,0 +1,95 @@
+# REDCOES - Tablas paginadas en el servidor con búsqueda indexada
+
+import math
+import unicodedata
+import numpy as np
+import pandas as pd
+import streamlit as st
+from cache_ttl import MemoDebil
+from metricas import medir
+
+TAMANOS_PAGINA = [25, 50, 100, 250]
+
+_memo = MemoDebil()
+
+
+def normalizar_texto(serie):
+    # Minúsculas y sin tildes para que "jose" encuentre "José"
+    texto = serie.astype("string").fillna("").str.lower()
+    return texto.map(lambda t: unicodedata.normalize("NFKD", t).encode("ascii", "ignore").decode("ascii"))
+
+
+class IndiceTexto:
+    # Índice invertido de palabras -> posiciones de fila. Las palabras se guardan
+    # ordenadas para resolver búsquedas por prefijo con búsqueda binaria.
+    def __init__(self, df, columnas):
+        texto = pd.Series("", index=np.arange(len(df)), dtype="string")
+        for col in columnas:
+            texto = texto + " " + normalizar_texto(df[col].reset_index(drop=True))
+        palabras = texto.str.findall(r"\w+").explode().dropna()
+        pares = pd.DataFrame({"palabra": palabras.to_numpy(dtype=object), "pos": palabras.index.to_numpy()})
+        pares = pares.drop_duplicates().sort_values(["palabra", "pos"])
+        self._palabras = pares["palabra"].to_numpy(dtype=object)
+        self._posiciones = pares["pos"].to_numpy()
+
+    def buscar(self, consulta):
+        # Posiciones de las filas que contienen todas las palabras (como prefijo)
+        terminos = normalizar_texto(pd.Series([consulta])).str.findall(r"\w+").iloc[0]
+        resultado = None
+        for termino in terminos:
+            desde = np.searchsorted(self._palabras, termino, side="left")
+            hasta = np.searchsorted(self._palabras, termino + "\uffff", side="left")
+            posiciones = np.unique(self._posiciones[desde:hasta])
+            resultado = posiciones if resultado is None else np.intersect1d(resultado, posiciones, assume_unique=True)
+        return resultado
+
+
+def _orden(df, columna, descendente):
+    # Posiciones de fila ordenadas; se calculan una vez por DataFrame y columna
+    def construir():
+        valores = df[columna].reset_index(drop=True)
+        return valores.sort_values(ascending=not descendente, kind="stable", na_position="last").index.to_numpy()
+    return _memo.obtener(df, ("orden", columna, descendente), construir)
+
+
+def tabla_paginada(df, clave, columnas_busqueda=None, orden_inicial=None, columnas_visibles=None, filas=None):
+    # Ordena, filtra y corta la página en el servidor: al navegador solo se envían
+    # las filas y columnas visibles. filas es una máscara booleana opcional sobre df;
+    # así el orden y el índice de búsqueda del DataFrame completo se reutilizan
+    # aunque cambien los filtros.
+    columnas = list(df.columns)
+    orden_col, orden_desc = orden_inicial or (columnas[0], False)
+
+    col_busqueda, col_orden, col_desc, col_tamano = st.columns([3, 2, 1, 1])
+    consulta = col_busqueda.text_input("🔍 Buscar", key=f"{clave}_buscar") if columnas_busqueda else ""
+    orden_col = col_orden.selectbox("Ordenar por", columnas, index=columnas.index(orden_col), key=f"{clave}_orden")
+    orden_desc = col_desc.checkbox("Descendente", value=orden_desc, key=f"{clave}_desc")
+    tamano = col_tamano.selectbox("Filas", TAMANOS_PAGINA, index=1, key=f"{clave}_tamano")
+
+    with st.expander("Columnas visibles"):
+        visibles = st.multiselect("Columnas", columnas, default=columnas_visibles or columnas,
+                                  key=f"{clave}_columnas", label_visibility="collapsed")
+
+    posiciones = _orden(df, orden_col, orden_desc)
+    if filas is not None:
+        posiciones = posiciones[np.asarray(filas, dtype=bool)[posiciones]]
+    if consulta.strip():
+        def construir_indice():
+            with medir("indice_busqueda"):
+                return IndiceTexto(df, columnas_busqueda)
+        indice = _memo.obtener(df, ("indice", tuple(columnas_busqueda)), construir_indice)
+        encontrados = indice.buscar(consulta)
+        if encontrados is not None:
+            posiciones = posiciones[np.isin(posiciones, encontrados, assume_unique=True)]
+
+    total = len(posiciones)
+    paginas = max(1, math.ceil(total / tamano))
+    clave_pagina = f"{clave}_pagina"
+    if st.session_state.get(clave_pagina, 1) > paginas:
+        st.session_state[clave_pagina] = 1
+    pagina = st.number_input("Página", min_value=1, max_value=paginas, step=1, key=clave_pagina)
+
+    inicio = (pagina - 1) * tamano
+    fin = min(inicio + tamano, total)
+    st.dataframe(df.iloc[posiciones[inicio:fin]][visibles or columnas], use_container_width=True, hide_index=True)
+    st.caption(f"Filas {inicio + 1 if total else 0}–{fin} de {total} · página {pagina} de {paginas}")
@@ -0,0 +1,508 @@
+# REDCOES - Trabajos por lotes en Moodle: matrículas masivas y clonación de cursos
+#
+# Cada trabajo se guarda en SQLite como una lista de pasos: crear el curso,
+# importar su contenido y un paso por cada lote de matrículas. Cada paso registra
+# su estado, intentos y resultado, así que un trabajo interrumpido (un error, un
+# reinicio del proceso) se reanuda desde los pasos pendientes sin repetir los
+# que ya terminaron.
+
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import pandas as pd
+from almacen_local import conectar, solicitar_actualizacion
+from moodle_api import (
+    cliente, codificar_lista, olvidar_matriculas, FACTOR_ESPERA,
+    MoodleError, MoodleConexionError, MoodleTokenInvalido, MoodleAccesoDenegado, MoodleParametroInvalido
+)
+from metricas import medir
+
+# CONFIGURACIÓN
+TAMANO_LOTE = int(os.getenv("MOODLE_LOTE_MATRICULAS", "100"))
+CONCURRENCIA_LOTES = int(os.getenv("MOODLE_CONCURRENCIA_LOTES", "4"))
+REINTENTOS_LOTE = int(os.getenv("MOODLE_REINTENTOS_LOTE", "3"))
+ROL_ESTUDIANTE = 5
+
+# Columnas aceptadas en el CSV (en minúsculas y con "_" en lugar de espacios)
+COLUMNAS_USUARIO = {
+    "userid": "id", "user_id": "id", "email": "email", "correo": "email", "username": "username", "usuario": "username",
+}
+COLUMNAS_CURSO = ["course_id", "courseid", "curso"]
+COLUMNAS_ROL = ["roleid", "role_id", "rol"]
+
+logger = logging.getLogger(__name__)
+
+
+class ImportacionIncierta(MoodleError):
+    # Una importación anterior se cortó (red, reinicio) y pudo completarse en Moodle
+    pass
+
+
+# LLAMADAS A MOODLE
+
+def matricular(enrolments):
+    # enrolments: [{"roleid", "userid", "courseid"}]; volver a matricular a
+    # alguien que ya lo está no falla, por eso los lotes se pueden repetir
+    return cliente.llamar("enrol_manual_enrol_users", codificar_lista("enrolments", enrolments))
+
+
+# Las operaciones que crean contenido no se reintentan para no duplicarlo
+def crear_curso(nombre, nombre_corto, categoria_id):
+    creados = cliente.llamar("core_course_create_courses", codificar_lista("courses", [{
+        "fullname": nombre, "shortname": nombre_corto, "categoryid": categoria_id
+    }]), reintentos=0)
+    return int(creados[0]["id"])
+
+
+def importar_contenido_curso(origen_id, destino_id):
+    return cliente.llamar("core_course_import_course", {
+        "importfrom": origen_id,
+        "importto": destino_id
+    }, reintentos=0)
+
+
+def buscar_curso(nombre_corto):
+    respuesta = cliente.llamar("core_course_get_courses_by_field", {"field": "shortname", "value": nombre_corto})
+    cursos = respuesta.get("courses", []) if isinstance(respuesta, dict) else []
+    return int(cursos[0]["id"]) if cursos else None
+
+
+def resolver_usuarios(campo, valores):
+    # {valor en minúsculas: id} de los usuarios que existen en Moodle
+    params = {"field": campo}
+    params.update({f"values[{i}]": valor for i, valor in enumerate(valores)})
+    usuarios = cliente.llamar("core_user_get_users_by_field", params)
+    return {str(u.get(campo, "")).lower(): int(u["id"]) for u in usuarios}
+
+
+# ENTRADA
+
+def _enteros(serie):
+    numeros = pd.to_numeric(serie, errors="coerce")
+    return numeros.where(numeros % 1 == 0).astype("Int64")
+
+
+def leer_matriculas(origen, role_id=ROL_ESTUDIANTE, con_curso=True):
+    # origen: DataFrame o CSV (ruta o archivo, p. ej. el de st.file_uploader).
+    # Devuelve (filas, descartadas): filas con course_id, campo ("id", "email" o
+    # "username"), valor y roleid; descartadas es la cantidad de filas sin datos válidos.
+    if isinstance(origen, pd.DataFrame):
+        df = origen.copy()
+    else:
+        try:
+            df = pd.read_csv(origen, dtype=str, sep=None, engine="python", encoding="utf-8-sig")
+        except (ValueError, UnicodeDecodeError, pd.errors.ParserError) as e:
+            raise ValueError(f"No se pudo leer el CSV: {e}")
+    df.columns = [str(col).strip().lower().replace(" ", "_") for col in df.columns]
+
+    col_usuario = next((col for col in COLUMNAS_USUARIO if col in df.columns), None)
+    if col_usuario is None:
+        raise ValueError("Falta la columna de usuario: " + ", ".join(COLUMNAS_USUARIO))
+    col_curso = next((col for col in COLUMNAS_CURSO if col in df.columns), None)
+    if con_curso and col_curso is None:
+        raise ValueError("Falta la columna de curso: " + ", ".join(COLUMNAS_CURSO))
+    col_rol = next((col for col in COLUMNAS_ROL if col in df.columns), None)
+
+    campo = COLUMNAS_USUARIO[col_usuario]
+    valores = df[col_usuario].astype("string").str.strip()
+    if campo == "id":
+        valores = _enteros(valores).astype("string")
+    else:
+        valores = valores.str.lower()
+    filas = pd.DataFrame({
+        "course_id": _enteros(df[col_curso]) if con_curso else pd.NA,
+        "campo": campo,
+        "valor": valores.mask(valores.fillna("") == ""),
+        "roleid": pd.to_numeric(df[col_rol], errors="coerce").fillna(role_id).astype("int64") if col_rol else role_id,
+    })
+    validas = filas.dropna(subset=["course_id", "valor"] if con_curso else ["valor"])
+    descartadas = len(filas) - len(validas)
+    return validas.drop_duplicates(["course_id", "campo", "valor"]).reset_index(drop=True), descartadas
+
+
+# REGISTRO DE TRABAJOS EN SQLITE
+
+_lock_bd = threading.Lock()
+
+
+def _conectar():
+    conexion = conectar()
+    conexion.execute(
+        "CREATE TABLE IF NOT EXISTS trabajos (id INTEGER PRIMARY KEY AUTOINCREMENT, tipo TEXT, descripcion TEXT, "
+        "estado TEXT, parametros TEXT, error TEXT, creado REAL, actualizado REAL)"
+    )
+    conexion.execute(
+        "CREATE TABLE IF NOT EXISTS trabajo_pasos (trabajo_id INTEGER, numero INTEGER, tipo TEXT, estado TEXT, "
+        "intentos INTEGER DEFAULT 0, datos TEXT, resultado TEXT, error TEXT, actualizado REAL, "
+        "PRIMARY KEY (trabajo_id, numero))"
+    )
+    return conexion
+
+
+def _escribir(consulta, parametros=()):
+    with _lock_bd:
+        conexion = _conectar()
+        try:
+            with conexion:
+                return conexion.execute(consulta, parametros).lastrowid
+        finally:
+            conexion.close()
+
+
+def _leer(consulta, parametros=()):
+    conexion = _conectar()
+    try:
+        return conexion.execute(consulta, parametros).fetchall()
+    finally:
+        conexion.close()
+
+
+def _lotes(filas, tamano_lote):
+    # Una fila por matrícula: [course_id o None, campo, valor, roleid]
+    registros = [
+        [None if pd.isna(course_id) else int(course_id), campo, str(valor), int(rol)]
+        for course_id, campo, valor, rol in filas[["course_id", "campo", "valor", "roleid"]].itertuples(index=False)
+    ]
+    return [("matricular", {"filas": registros[i:i + tamano_lote]}) for i in range(0, len(registros), tamano_lote)]
+
+
+def _crear_trabajo(tipo, descripcion, parametros, pasos):
+    ahora = time.time()
+    with _lock_bd:
+        conexion = _conectar()
+        try:
+            with conexion:
+                trabajo_id = conexion.execute(
+                    "INSERT INTO trabajos (tipo, descripcion, estado, parametros, creado, actualizado) "
+                    "VALUES (?, ?, 'pendiente', ?, ?, ?)",
+                    (tipo, descripcion, json.dumps(parametros), ahora, ahora)
+                ).lastrowid
+                conexion.executemany(
+                    "INSERT INTO trabajo_pasos (trabajo_id, numero, tipo, estado, datos, actualizado) "
+                    "VALUES (?, ?, ?, 'pendiente', ?, ?)",
+                    [(trabajo_id, numero, tipo_paso, json.dumps(datos), ahora)
+                     for numero, (tipo_paso, datos) in enumerate(pasos, start=1)]
+                )
+        finally:
+            conexion.close()
+    return trabajo_id
+
+
+def crear_trabajo_matriculas(filas, tamano_lote=TAMANO_LOTE):
+    # filas: resultado de leer_matriculas
+    if filas.empty:
+        raise ValueError("No hay matrículas válidas para procesar")
+    cursos = sorted(int(c) for c in pd.unique(filas["course_id"]))
+    descripcion = f"{len(filas)} matrícula(s) en {len(cursos)} curso(s)"
+    return _crear_trabajo("matriculas", descripcion, {"cursos": cursos}, _lotes(filas, tamano_lote))
+
+
+def crear_trabajo_clonacion(origen_id, nombre, nombre_corto, categoria_id, filas=None, importar=True,
+                            tamano_lote=TAMANO_LOTE):
+    # Crea el curso nuevo, opcionalmente importa el contenido de origen_id y
+    # matricula las filas (sin course_id) en el curso creado
+    pasos = [("crear_curso", {"nombre": nombre, "nombre_corto": nombre_corto, "categoria_id": int(categoria_id)})]
+    if importar:
+        pasos.append(("importar_contenido", {"origen_id": int(origen_id)}))
+    cantidad = 0
+    if filas is not None and not filas.empty:
+        pasos += _lotes(filas, tamano_lote)
+        cantidad = len(filas)
+    descripcion = f"Clonar {origen_id} como {nombre_corto} y matricular {cantidad} usuario(s)"
+    return _crear_trabajo("clonacion", descripcion, {"origen_id": int(origen_id), "cursos": []}, pasos)
+
+
+def _actualizar_trabajo(trabajo_id, estado, error=None):
+    _escribir("UPDATE trabajos SET estado = ?, error = ?, actualizado = ? WHERE id = ?",
+              (estado, error, time.time(), trabajo_id))
+
+
+def _actualizar_paso(trabajo_id, numero, estado, resultado=None, error=None, intento=False):
+    _escribir(
+        "UPDATE trabajo_pasos SET estado = ?, resultado = COALESCE(?, resultado), error = ?, "
+        "intentos = intentos + ?, actualizado = ? WHERE trabajo_id = ? AND numero = ?",
+        (estado, json.dumps(resultado) if resultado is not None else None, error, int(intento), time.time(),
+         trabajo_id, numero)
+    )
+
+
+def _pasos(trabajo_id, estados):
+    marcadores = ", ".join("?" for _ in estados)
+    filas = _leer(
+        f"SELECT numero, tipo, estado, intentos, datos, resultado FROM trabajo_pasos "
+        f"WHERE trabajo_id = ? AND estado IN ({marcadores}) ORDER BY numero",
+        (trabajo_id, *estados)
+    )
+    return [
+        {"numero": n, "tipo": t, "estado": e, "intentos": i, "datos": json.loads(d),
+         "resultado": json.loads(r) if r else None}
+        for n, t, e, i, d, r in filas
+    ]
+
+
+def _dividir(trabajo_id, paso):
+    # Reemplaza un lote por dos mitades que se procesan por separado
+    filas = paso["datos"]["filas"]
+    mitad = len(filas) // 2
+    ahora = time.time()
+    with _lock_bd:
+        conexion = _conectar()
+        try:
+            with conexion:
+                ultimo = conexion.execute(
+                    "SELECT MAX(numero) FROM trabajo_pasos WHERE trabajo_id = ?", (trabajo_id,)
+                ).fetchone()[0]
+                nuevos = [(ultimo + 1, filas[:mitad]), (ultimo + 2, filas[mitad:])]
+                conexion.executemany(
+                    "INSERT INTO trabajo_pasos (trabajo_id, numero, tipo, estado, datos, actualizado) "
+                    "VALUES (?, ?, 'matricular', 'pendiente', ?, ?)",
+                    [(trabajo_id, numero, json.dumps({"filas": parte}), ahora) for numero, parte in nuevos]
+                )
+                conexion.execute(
+                    "UPDATE trabajo_pasos SET estado = 'dividido', actualizado = ? WHERE trabajo_id = ? AND numero = ?",
+                    (ahora, trabajo_id, paso["numero"])
+                )
+        finally:
+            conexion.close()
+    return [
+        {"numero": numero, "tipo": "matricular", "estado": "pendiente", "intentos": 0,
+         "datos": {"filas": parte}, "resultado": None}
+        for numero, parte in nuevos
+    ]
+
+
+# EJECUCIÓN
+
+def _curso_destino(trabajo_id):
+    # Curso creado por el trabajo (clonación), si ya se creó
+    fila = _leer(
+        "SELECT resultado FROM trabajo_pasos WHERE trabajo_id = ? AND tipo = 'crear_curso' AND estado = 'completado'",
+        (trabajo_id,)
+    )
+    return json.loads(fila[0][0])["course_id"] if fila else None
+
+
+def _ejecutar_paso_unico(trabajo_id, paso):
+    # Crear e importar: no se reintentan solos. Si el proceso se interrumpió a
+    # mitad de uno de ellos no se sabe si Moodle llegó a completarlo.
+    datos = paso["datos"]
+    incierto = paso["estado"] == "en_curso" or (paso["resultado"] or {}).get("incierto", False)
+    _actualizar_paso(trabajo_id, paso["numero"], "en_curso", intento=True)
+    try:
+        with medir(f"trabajo_{paso['tipo']}", "segundo_plano"):
+            if paso["tipo"] == "crear_curso":
+                # Un intento anterior cortado por la red pudo crear el curso sin
+                # registrarlo: se busca antes de crearlo otra vez
+                course_id = buscar_curso(datos["nombre_corto"]) if incierto else None
+                if course_id is None:
+                    course_id = crear_curso(datos["nombre"], datos["nombre_corto"], datos["categoria_id"])
+                resultado = {"course_id": course_id}
+            else:
+                if incierto:
+                    # Repetirla duplicaría el contenido si Moodle sí la completó
+                    raise ImportacionIncierta(
+                        "La importación anterior se cortó y pudo completarse en Moodle; "
+                        "revisa el curso y confirma si hay que repetirla"
+                    )
+                destino = _curso_destino(trabajo_id)
+                if destino is None:
+                    raise MoodleError("El curso de destino todavía no existe")
+                importar_contenido_curso(datos["origen_id"], destino)
+                resultado = {"course_id": destino}
+    except Exception as e:
+        resultado = {"incierto": True} if isinstance(e, (MoodleConexionError, ImportacionIncierta)) else None
+        _actualizar_paso(trabajo_id, paso["numero"], "error", resultado=resultado, error=str(e) or e.__class__.__name__)
+        raise
+    _actualizar_paso(trabajo_id, paso["numero"], "completado", resultado=resultado)
+
+
+def _matricular_lote(filas, course_id):
+    ids = {}
+    for campo in {fila[1] for fila in filas if fila[1] != "id"}:
+        ids[campo] = resolver_usuarios(campo, sorted({fila[2] for fila in filas if fila[1] == campo}))
+
+    enrolments, no_encontrados = [], []
+    for curso, campo, valor, rol in filas:
+        user_id = int(valor) if campo == "id" else ids[campo].get(valor)
+        if user_id is None:
+            no_encontrados.append(valor)
+            continue
+        enrolments.append({"roleid": rol, "userid": user_id, "courseid": curso if curso is not None else course_id})
+    if enrolments:
+        matricular(enrolments)
+    return {"matriculados": len(enrolments), "no_encontrados": no_encontrados}
+
+
+def _ejecutar_lote(trabajo_id, paso, course_id):
+    filas = paso["datos"]["filas"]
+    _actualizar_paso(trabajo_id, paso["numero"], "en_curso")
+    for intento in range(REINTENTOS_LOTE + 1):
+        try:
+            with medir("trabajo_lote_matriculas", "segundo_plano"):
+                resultado = _matricular_lote(filas, course_id)
+        except (MoodleTokenInvalido, MoodleAccesoDenegado) as e:
+            # Repetir no sirve de nada: se detiene todo el trabajo
+            _actualizar_paso(trabajo_id, paso["numero"], "error", error=str(e), intento=True)
+            raise
+        except MoodleParametroInvalido as e:
+            # Moodle rechaza el lote completo si una sola matrícula no es válida:
+            # se divide en mitades hasta aislarla y el resto se matricula igual
+            if len(filas) > 1:
+                for mitad in _dividir(trabajo_id, paso):
+                    _ejecutar_lote(trabajo_id, mitad, course_id)
+                return
+            _actualizar_paso(trabajo_id, paso["numero"], "error", error=str(e), intento=True)
+            return
+        except MoodleError as e:
+            _actualizar_paso(trabajo_id, paso["numero"], "en_curso", error=str(e), intento=True)
+            if intento < REINTENTOS_LOTE:
+                time.sleep(FACTOR_ESPERA * 2 ** intento)
+                continue
+            _actualizar_paso(trabajo_id, paso["numero"], "error", error=str(e))
+            return
+        else:
+            _actualizar_paso(trabajo_id, paso["numero"], "completado", resultado=resultado, intento=True)
+            return
+
+
+def ejecutar(trabajo_id, reintentar_fallidos=False):
+    # Procesa los pasos pendientes (y los interrumpidos). Con reintentar_fallidos
+    # también los lotes que terminaron con error; crear o importar el curso se
+    # vuelven a intentar siempre, porque sin ellos no se puede matricular. Los
+    # lotes de matrículas corren en paralelo hasta CONCURRENCIA_LOTES a la vez.
+    _actualizar_trabajo(trabajo_id, "en_curso")
+    pasos = [
+        paso for paso in _pasos(trabajo_id, ("pendiente", "en_curso", "error"))
+        if reintentar_fallidos or paso["estado"] != "error" or paso["tipo"] != "matricular"
+    ]
+    cursos = set()
+    try:
+        for paso in pasos:
+            if paso["tipo"] != "matricular":
+                _ejecutar_paso_unico(trabajo_id, paso)
+                if paso["tipo"] == "crear_curso":
+                    solicitar_actualizacion("cursos")
+
+        lotes = [paso for paso in pasos if paso["tipo"] == "matricular"]
+        # En una clonación no se matricula hasta que el curso esté creado e importado:
+        # sin curso Moodle rechaza cada matrícula y los lotes se dividen hasta una fila
+        sin_completar = _leer(
+            "SELECT COUNT(*) FROM trabajo_pasos WHERE trabajo_id = ? AND tipo != 'matricular' "
+            "AND estado != 'completado'", (trabajo_id,)
+        )[0][0]
+        if lotes and sin_completar:
+            raise MoodleError("El curso de destino no está creado o su contenido no está importado; "
+                              "no se matricula hasta completar esos pasos")
+        course_id = _curso_destino(trabajo_id)
+        cursos.update(fila[0] if fila[0] is not None else course_id for paso in lotes for fila in paso["datos"]["filas"])
+        if lotes:
+            with ThreadPoolExecutor(max_workers=max(1, min(CONCURRENCIA_LOTES, len(lotes)))) as executor:
+                # list() para que una excepción de un lote llegue hasta aquí
+                list(executor.map(lambda paso: _ejecutar_lote(trabajo_id, paso, course_id), lotes))
+    except Exception as e:
+        logger.exception("El trabajo %s falló", trabajo_id)
+        _actualizar_trabajo(trabajo_id, "error", str(e) or e.__class__.__name__)
+    else:
+        con_errores = _leer(
+            "SELECT COUNT(*) FROM trabajo_pasos WHERE trabajo_id = ? AND estado = 'error'", (trabajo_id,)
+        )[0][0]
+        _actualizar_trabajo(trabajo_id, "con_errores" if con_errores else "completado")
+    finally:
+        olvidar_matriculas(sorted(c for c in cursos if c is not None))
+
+
+_hilos = {}  # trabajo_id -> hilo que lo está ejecutando en este proceso
+_lock_hilos = threading.Lock()
+
+
+def iniciar(trabajo_id, reintentar_fallidos=False):
+    # Ejecuta (o reanuda) el trabajo en segundo plano; devuelve False si ya está en curso
+    with _lock_hilos:
+        hilo = _hilos.get(trabajo_id)
+        if hilo is not None and hilo.is_alive():
+            return False
+        hilo = threading.Thread(target=ejecutar, args=(trabajo_id, reintentar_fallidos),
+                                name=f"trabajo-moodle-{trabajo_id}", daemon=True)
+        _hilos[trabajo_id] = hilo
+        hilo.start()
+    return True
+
+
+def en_ejecucion(trabajo_id):
+    with _lock_hilos:
+        hilo = _hilos.get(trabajo_id)
+        return hilo is not None and hilo.is_alive()
+
+
+def resolver_importacion(trabajo_id, numero, ya_importada):
+    # Decisión del usuario después de revisar el curso en Moodle: si el contenido
+    # ya está, el paso se da por completado; si no, se vuelve a importar
+    if ya_importada:
+        _actualizar_paso(trabajo_id, numero, "completado", resultado={"course_id": _curso_destino(trabajo_id)})
+    else:
+        _actualizar_paso(trabajo_id, numero, "pendiente", resultado={"incierto": False})
+
+
+# CONSULTAS PARA LA INTERFAZ
+
+def listar_trabajos(limite=50):
+    filas = _leer(
+        "SELECT id, tipo, descripcion, estado, creado, actualizado FROM trabajos ORDER BY id DESC LIMIT ?", (limite,)
+    )
+    df = pd.DataFrame(filas, columns=["id", "tipo", "descripcion", "estado", "creado", "actualizado"])
+    # Un trabajo "en_curso" sin hilo en este proceso quedó interrumpido (p. ej. por un reinicio)
+    interrumpidos = (df["estado"] == "en_curso") & ~df["id"].map(en_ejecucion).astype(bool)
+    df.loc[interrumpidos, "estado"] = "interrumpido"
+    for col in ("creado", "actualizado"):
+        df[col] = df[col].map(lambda t: datetime.fromtimestamp(t).strftime("%d/%m/%Y %H:%M"))
+    return df
+
+
+def progreso(trabajo_id):
+    trabajo = _leer("SELECT estado, error FROM trabajos WHERE id = ?", (trabajo_id,))
+    if not trabajo:
+        return None
+    estado, error = trabajo[0]
+    if estado == "en_curso" and not en_ejecucion(trabajo_id):
+        estado = "interrumpido"
+    pasos = _leer(
+        "SELECT estado, resultado FROM trabajo_pasos WHERE trabajo_id = ? AND estado != 'dividido'", (trabajo_id,)
+    )
+    resultados = [json.loads(r) for e, r in pasos if e == "completado" and r]
+    return {
+        "estado": estado,
+        "error": error,
+        "pasos": len(pasos),
+        "completados": sum(e == "completado" for e, _ in pasos),
+        "errores": sum(e == "error" for e, _ in pasos),
+        "matriculados": sum(r.get("matriculados", 0) for r in resultados),
+        "no_encontrados": sum(len(r.get("no_encontrados", [])) for r in resultados),
+        "course_id": _curso_destino(trabajo_id),
+    }
+
+
+def pasos_con_error(trabajo_id):
+    filas = _leer(
+        "SELECT numero, tipo, intentos, error, datos, resultado FROM trabajo_pasos "
+        "WHERE trabajo_id = ? AND estado = 'error' ORDER BY numero", (trabajo_id,)
+    )
+    # revisar: importación que pudo completarse y espera la decisión del usuario
+    return pd.DataFrame(
+        [(n, t, i, e, len(json.loads(d).get("filas", [])),
+          t == "importar_contenido" and bool(json.loads(r or "{}").get("incierto")))
+         for n, t, i, e, d, r in filas],
+        columns=["paso", "tipo", "intentos", "error", "filas", "revisar"]
+    )
+
+
+def usuarios_no_encontrados(trabajo_id):
+    filas = _leer(
+        "SELECT resultado FROM trabajo_pasos WHERE trabajo_id = ? AND estado = 'completado' AND tipo = 'matricular'",
+        (trabajo_id,)
+    )
+    valores = [valor for (r,) in filas if r for valor in json.loads(r).get("no_encontrados", [])]
+    return pd.DataFrame({"usuario": valores})
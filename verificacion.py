@@ -0,0 +1,130 @@
+# REDCOES - Verificación de la clave de acceso con caché y token firmado
+
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+import requests
+from cache_ttl import CacheTTL, UnVuelo
+from metricas import medir, registrar_cache
+
+# Misma base que wordpress_api; se lee aquí para no cargar pandas en la pantalla de acceso
+WP_API_URL = os.getenv("REDCOES_WP_URL", "https://reddecontadores.com/wp-json/redcoes/v1")
+DURACION = int(os.getenv("REDCOES_VERIFICACION_TTL", "900"))
+TIMEOUT = float(os.getenv("REDCOES_VERIFICACION_TIMEOUT", "5"))
+# Sin secreto configurado se genera uno por proceso: los tokens no sobreviven un reinicio
+SECRETO = os.getenv("REDCOES_SECRETO", "").encode() or secrets.token_bytes(32)
+# Archivo con claves a revocar (una por línea; "*" revoca todos los tokens)
+ARCHIVO_REVOCACIONES = os.getenv("REDCOES_REVOCACIONES", "")
+
+# Huellas de claves ya verificadas contra WordPress (compartidas entre sesiones)
+_verificadas = CacheTTL(max_entradas=1000, ttl=DURACION)
+# Huellas revocadas; basta con recordarlas lo que dura un token
+_revocadas = CacheTTL(max_entradas=1000, ttl=DURACION)
+_generacion = 0
+_lock = threading.Lock()
+# Varias sesiones que entran a la vez con la misma clave hacen una sola consulta
+_vuelos = UnVuelo()
+# Estado del archivo de revocaciones: última modificación vista y líneas ya aplicadas
+_archivo_visto = None
+_lineas_aplicadas = set()
+_lock_archivo = threading.Lock()
+
+
+def _firmar(texto):
+    return hmac.new(SECRETO, texto.encode(), hashlib.sha256).hexdigest()
+
+
+def _huella(clave):
+    # La clave nunca se guarda en claro, ni en memoria compartida ni en el token
+    return _firmar(f"clave:{clave}")
+
+
+def emitir_token(clave):
+    datos = f"{_huella(clave)}.{int(time.time()) + DURACION}.{_generacion}"
+    return f"{datos}.{_firmar(datos)}"
+
+
+def token_valido(token, clave):
+    try:
+        huella, expira, generacion, firma = token.split(".")
+        vigente = int(expira) > time.time() and int(generacion) == _generacion
+    except (AttributeError, ValueError):
+        return False
+    return (
+        vigente
+        and hmac.compare_digest(firma, _firmar(f"{huella}.{expira}.{generacion}"))
+        and hmac.compare_digest(huella, _huella(clave))
+        and huella not in _revocadas
+    )
+
+
+def verificar_remoto(clave):
+    with medir("verificar", "wordpress") as medicion:
+        respuesta = requests.get(f"{WP_API_URL}/verificar", params={"key": clave}, timeout=TIMEOUT)
+        medicion["bytes"] = len(respuesta.content)
+        return respuesta.status_code == 200 and respuesta.json().get("status") == "ok"
+
+
+def aplicar_revocaciones():
+    # Cada línea nueva del archivo se aplica una vez por proceso; para volver a revocar
+    # todo basta con agregar otra línea que empiece con "*" (por ejemplo "* 2026-10-17")
+    global _archivo_visto
+    if not ARCHIVO_REVOCACIONES:
+        return
+    with _lock_archivo:
+        try:
+            modificado = os.stat(ARCHIVO_REVOCACIONES).st_mtime_ns
+            if modificado == _archivo_visto:
+                return
+            with open(ARCHIVO_REVOCACIONES, encoding="utf-8") as f:
+                lineas = {linea.strip() for linea in f if linea.strip()}
+        except FileNotFoundError:
+            return
+        _archivo_visto = modificado
+        nuevas = lineas - _lineas_aplicadas
+        _lineas_aplicadas.update(nuevas)
+    for linea in nuevas:
+        if linea.startswith("*"):
+            revocar_todo()
+        else:
+            revocar(linea)
+
+
+def verificar(clave, token=None):
+    # Devuelve (válida, token). Solo consulta a WordPress si no hay un token vigente
+    # para esta clave ni una verificación reciente en el proceso.
+    aplicar_revocaciones()
+    if token and token_valido(token, clave):
+        registrar_cache("verificacion", True)
+        return True, token
+
+    huella = _huella(clave)
+    if huella not in _revocadas and _verificadas.obtener(huella) == _generacion:
+        registrar_cache("verificacion", True)
+        return True, emitir_token(clave)
+
+    registrar_cache("verificacion", False)
+
+    if _vuelos.ejecutar(huella, lambda: verificar_remoto(clave)):
+        _revocadas.invalidar(huella)
+        _verificadas.guardar(huella, _generacion)
+        return True, emitir_token(clave)
+    return False, None
+
+
+def revocar(clave):
+    # Invalida la verificación y los tokens emitidos para una clave
+    huella = _huella(clave)
+    _verificadas.invalidar(huella)
+    _revocadas.guardar(huella, True)
+
+
+def revocar_todo():
+    # Invalida todos los tokens emitidos por este proceso
+    global _generacion
+    with _lock:
+        _generacion += 1
+        _verificadas.limpiar()
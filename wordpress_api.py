@@ -0,0 +1,122 @@
+# REDCOES - Acceso a los endpoints /redcoes/v1 de WordPress
+
+import os
+import threading
+import time
+import pandas as pd
+import requests
+from almacen_local import conectar, existe_tabla, columnas_tabla
+from esquemas import aplicar_esquema, agregar_periodo
+from metricas import medir
+
+# CONFIGURACIÓN
+WP_API_URL = os.getenv("REDCOES_WP_URL", "https://reddecontadores.com/wp-json/redcoes/v1")
+WP_TIMEOUT = float(os.getenv("REDCOES_WP_TIMEOUT", "60"))
+PEDIDOS_INCREMENTAL = os.getenv("REDCOES_PEDIDOS_INCREMENTAL", "1") == "1"
+VENTANA_RECIENTE_DIAS = int(os.getenv("REDCOES_PEDIDOS_VENTANA_DIAS", "30"))
+RESINCRONIZAR_HORAS = float(os.getenv("REDCOES_PEDIDOS_RESINCRONIZAR_HORAS", "24"))
+
+_lock_pedidos = threading.Lock()
+
+
+def obtener_json(endpoint, clave, **params):
+    with medir(endpoint, "wordpress") as medicion:
+        respuesta = requests.get(f"{WP_API_URL}/{endpoint}", params={"key": clave, **params}, timeout=WP_TIMEOUT)
+        medicion["bytes"] = len(respuesta.content)
+        respuesta.raise_for_status()
+        return respuesta.json()
+
+
+def normalizar_columnas(df):
+    df.columns = [col.strip().lower().replace(" ", "_") for col in df.columns]
+    return df
+
+
+# SINCRONIZACIÓN INCREMENTAL DE PEDIDOS
+
+def _ultima_sincronizacion_completa(conexion):
+    conexion.execute("CREATE TABLE IF NOT EXISTS sincronizaciones (dataset TEXT PRIMARY KEY, ultima_completa REAL)")
+    fila = conexion.execute("SELECT ultima_completa FROM sincronizaciones WHERE dataset = 'pedidos'").fetchone()
+    return fila[0] if fila else None
+
+
+def _sincronizacion_completa(conexion, clave):
+    df = normalizar_columnas(pd.DataFrame(obtener_json("pedidos", clave)))
+    with conexion:
+        df.to_sql("pedidos", conexion, if_exists="replace", index=False)
+        conexion.execute(
+            "INSERT OR REPLACE INTO sincronizaciones (dataset, ultima_completa) VALUES ('pedidos', ?)", (time.time(),)
+        )
+
+
+def _sincronizacion_incremental(conexion, clave):
+    # Solo se piden los pedidos posteriores al último conocido, con una ventana
+    # hacia atrás para recoger cambios de estado de pedidos recientes
+    ultima_fecha = conexion.execute("SELECT MAX(fecha_pedido) FROM pedidos").fetchone()[0]
+    ultima_fecha = pd.to_datetime(ultima_fecha, errors="coerce")
+    if pd.isna(ultima_fecha):
+        _sincronizacion_completa(conexion, clave)
+        return
+    desde = (ultima_fecha - pd.Timedelta(days=VENTANA_RECIENTE_DIAS)).strftime("%Y-%m-%d")
+
+    nuevos = normalizar_columnas(pd.DataFrame(obtener_json("pedidos", clave, desde=desde)))
+    if nuevos.empty:
+        return
+
+    # Si el endpoint cambió de columnas no se pueden mezclar: se descarga todo de nuevo
+    columnas = columnas_tabla(conexion, "pedidos")
+    if set(nuevos.columns) != set(columnas):
+        _sincronizacion_completa(conexion, clave)
+        return
+
+    # Reemplazar por id los pedidos recibidos (nuevos o con cambios)
+    lista = ", ".join(f'"{c}"' for c in columnas)
+    with conexion:
+        nuevos.to_sql("pedidos_nuevos", conexion, if_exists="replace", index=False)
+        conexion.execute("DELETE FROM pedidos WHERE id IN (SELECT id FROM pedidos_nuevos)")
+        conexion.execute(f"INSERT INTO pedidos ({lista}) SELECT {lista} FROM pedidos_nuevos")
+        conexion.execute("DROP TABLE pedidos_nuevos")
+
+
+def sincronizar_pedidos(clave):
+    # Devuelve el historial completo de pedidos con columnas normalizadas.
+    # En modo incremental el historial se guarda en SQLite y solo se descargan
+    # los pedidos nuevos; periódicamente se hace una descarga completa para
+    # reflejar pedidos eliminados en WordPress.
+    if not PEDIDOS_INCREMENTAL:
+        return normalizar_columnas(pd.DataFrame(obtener_json("pedidos", clave)))
+
+    with _lock_pedidos:
+        conexion = conectar()
+        try:
+            ultima_completa = _ultima_sincronizacion_completa(conexion)
+            vencida = ultima_completa is None or time.time() - ultima_completa > RESINCRONIZAR_HORAS * 3600
+            incremental_posible = existe_tabla(conexion, "pedidos") and "id" in columnas_tabla(conexion, "pedidos")
+
+            if vencida or not incremental_posible:
+                _sincronizacion_completa(conexion, clave)
+            else:
+                _sincronizacion_incremental(conexion, clave)
+            return pd.read_sql("SELECT * FROM pedidos", conexion)
+        finally:
+            conexion.close()
+
+
+# CARGADORES
+# Funciones puras (sin Streamlit) para poder ejecutarse en hilos de fondo
+
+def cargar_pedidos(clave):
+    df = aplicar_esquema(sincronizar_pedidos(clave), "pedidos")
+    return agregar_periodo(df, 'fecha_pedido')
+
+
+def cargar_productos(clave):
+    df = normalizar_columnas(pd.DataFrame(obtener_json("productos", clave)))
+    return aplicar_esquema(df, "productos")
+
+
+def cargar_miembros(clave):
+    df = pd.DataFrame(obtener_json("miembros", clave))
+    df['membership_level'] = df['membership_level'].map({'2': 'miembro', '4': 'no miembro'}).fillna(df['membership_level'])
+    df = aplicar_esquema(df, "miembros")
+    return agregar_periodo(df, 'subscription_starts')
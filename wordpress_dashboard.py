@@ -2,17 +2,34 @@ import pandas as pd
 import streamlit as st
 import plotly.express as px
 import locale
-import requests
-import io
 from datetime import datetime
+import wordpress_api
+from almacen_local import cargar_con_snapshot, solicitar_actualizacion
+from esquemas import ErrorEsquema
+from planificador import mostrar_estado
+from cubo_pedidos import cubo_para, filtrar, mascara_filtros, resumen, por_dimension, por_fecha
+from exportacion import boton_exportar
+from series_tiempo import preparar_serie
+from tablas import tabla_paginada
+from metricas import medir, pestana, iniciar_rerun, terminar_rerun, mostrar_panel
+
+DATASETS = ["pedidos", "productos", "miembros"]
+
+# Establecer el locale en español si está disponible; una sola vez al importar el
+# módulo (setlocale afecta a todo el proceso y no es seguro entre hilos)
+try:
+    locale.setlocale(locale.LC_TIME, 'es_ES.UTF-8')
+except:
+    pass
+
+def conteo(serie, columnas):
+    # value_counts de una columna categórica incluye categorías sin filas; se descartan
+    conteos = serie.value_counts()
+    conteos = conteos[conteos > 0].reset_index()
+    conteos.columns = columnas
+    return conteos
 
 def main():
-    # Establecer el locale en español si está disponible
-    try:
-        locale.setlocale(locale.LC_TIME, 'es_ES.UTF-8')
-    except:
-        pass
-
     # Recuperar la clave desde el estado de sesión
     clave_api = st.session_state.get("clave_redcoes", None)
 
@@ -21,59 +38,46 @@ def main():
         st.stop()
 
     # Funciones para cargar los datos desde cada endpoint
-    @st.cache_data(ttl=0 if st.session_state.get("refrescar") else None)
+    # Se sirven desde memoria o desde el último snapshot en disco; el planificador
+    # los actualiza en segundo plano y refrescar solo adelanta esa actualización
+    if st.session_state.get("refrescar"):
+        solicitar_actualizacion(*DATASETS)
+
+    def cargar(nombre, cargador):
+        # Un valor que no cumple el esquema es un problema de datos, no de la clave:
+        # se informa aquí en lugar de dejarlo subir hasta el control de acceso.
+        # Devuelve (df, marca) del snapshot servido
+        try:
+            return cargar_con_snapshot(nombre, lambda: cargador(clave_api))
+        except ErrorEsquema as e:
+            st.error(f"❌ Los datos de {nombre} recibidos de WordPress no cumplen el esquema: {e}")
+            st.stop()
+
     def cargar_pedidos():
-        url = f"https://reddecontadores.com/wp-json/redcoes/v1/pedidos?key={clave_api}"
-        response = requests.get(url)
-        data = response.json()
-        df = pd.DataFrame(data)
-        df.columns = [col.strip().lower().replace(" ", "_") for col in df.columns]
-        df['total'] = pd.to_numeric(df['total'], errors='coerce')
-        df['fecha_pedido'] = pd.to_datetime(df['fecha_pedido'], errors='coerce')
-        df['año'] = df['fecha_pedido'].dt.year
-        df['mes_numero'] = df['fecha_pedido'].dt.month
-        df['mes'] = df['fecha_pedido'].dt.strftime('%B')
-        return df
-
-    @st.cache_data(ttl=0 if st.session_state.get("refrescar") else None)
+        return cargar("pedidos", wordpress_api.cargar_pedidos)
+
     def cargar_productos():
-        url = f"https://reddecontadores.com/wp-json/redcoes/v1/productos?key={clave_api}"
-        response = requests.get(url)
-        data = response.json()
-        df = pd.DataFrame(data)
-        df.columns = [col.strip().lower().replace(" ", "_") for col in df.columns]
-        df['precio_regular'] = pd.to_numeric(df['precio_regular'], errors='coerce')
-        return df
-
-    @st.cache_data(ttl=0 if st.session_state.get("refrescar") else None)
+        return cargar("productos", wordpress_api.cargar_productos)[0]
+
     def cargar_miembros():
-        url = f"https://reddecontadores.com/wp-json/redcoes/v1/miembros?key={clave_api}"
-        response = requests.get(url)
-        data = response.json()
-        df = pd.DataFrame(data)
-        df['subscription_starts'] = pd.to_datetime(df['subscription_starts'], errors='coerce')
-        df['año'] = df['subscription_starts'].dt.year
-        df['mes_numero'] = df['subscription_starts'].dt.month
-        df['mes'] = df['subscription_starts'].dt.strftime('%B')
-        df['membership_level'] = df['membership_level'].map({'2': 'miembro', '4': 'no miembro'}).fillna(df['membership_level'])
-        return df
-
-    # Crear pestañas
-    tab1, tab2, tab3, tab4 = st.tabs(["🚀 Pedidos de Hoy", "📊 Pedidos", "📦 Productos", "👥 Miembros"])
-
-    with tab1:
-        df = cargar_pedidos()
+        return cargar("miembros", wordpress_api.cargar_miembros)[0]
+
+    # Secciones: solo se carga y grafica la visible; las demás se calculan al verlas
+    # por primera vez y luego reutilizan los datos guardados y el cubo de pedidos
+
+    def seccion_pedidos_hoy():
+        df = cargar_pedidos()[0]
+        cubo = cubo_para(df)
         st.header("🚀 Pedidos de Hoy")
 
-        hoy = datetime.now().date()
-        pedidos_hoy = df[df['fecha_pedido'].dt.date == hoy]
+        hoy = pd.Timestamp(datetime.now().date())
+        pedidos_hoy = cubo[cubo['dia'] == hoy]
 
         if not pedidos_hoy.empty:
-            st.success(f"✅ Total pedidos hoy: {len(pedidos_hoy)}")
+            st.success(f"✅ Total pedidos hoy: {int(pedidos_hoy['pedidos'].sum())}")
 
             # Agrupar por producto
-            resumen_productos = pedidos_hoy['producto'].value_counts().reset_index()
-            resumen_productos.columns = ['Producto', 'Cantidad']
+            resumen_productos = por_dimension(pedidos_hoy, 'producto', ['Producto', 'Cantidad'])
 
             st.subheader("📋 Resumen por producto")
             st.dataframe(resumen_productos, use_container_width=True)
@@ -83,78 +87,77 @@ def main():
         else:
             st.warning("⚠️ No hay pedidos registrados hoy.")
 
-    with tab2:
-        df = cargar_pedidos()
+    def seccion_pedidos():
+        df, marca = cargar_pedidos()
+        # Métricas y gráficos salen del cubo; las filas solo se usan para el detalle
+        cubo = cubo_para(df)
         st.header("📊 Dashboard de Pedidos REDCOES")
 
         with st.expander("📋 Filtros de pedidos", expanded=True):
-            años = df['año'].dropna().sort_values().unique()
-            meses = df[['mes', 'mes_numero']].dropna().drop_duplicates().sort_values(by='mes_numero')
+            años = cubo['año'].dropna().sort_values().unique()
+            meses = cubo[['mes', 'mes_numero']].dropna().drop_duplicates().sort_values(by='mes_numero')
 
             años_seleccionados = st.multiselect("Año(s):", options=años[::-1], default=[max(años)])
             mes_inicio = st.selectbox("Desde el mes:", options=meses['mes'], index=0)
             mes_fin = st.selectbox("Hasta el mes:", options=meses['mes'], index=len(meses) - 1)
-            cursos = st.multiselect("Curso:", options=df['producto'].unique(), default=None)
-            modalidades = st.multiselect("Modalidad:", options=df['modalidad'].dropna().unique(), default=None)
-            afiliaciones = st.multiselect("Tipo de afiliación:", options=df['tipo_de_afiliacion'].dropna().unique(), default=None)
-            estados = st.multiselect("Estado:", options=df['estado'].unique(), default=['completed'])
+            cursos = st.multiselect("Curso:", options=cubo['producto'].unique(), default=None)
+            modalidades = st.multiselect("Modalidad:", options=cubo['modalidad'].dropna().unique(), default=None)
+            afiliaciones = st.multiselect("Tipo de afiliación:", options=cubo['tipo_de_afiliacion'].dropna().unique(), default=None)
+            estados = st.multiselect("Estado:", options=cubo['estado'].unique(), default=['completed'])
 
-        filtro = df.copy()
-        if años_seleccionados:
-            filtro = filtro[filtro['año'].isin(años_seleccionados)]
         mes_num_inicio = meses[meses['mes'] == mes_inicio]['mes_numero'].values[0]
         mes_num_fin = meses[meses['mes'] == mes_fin]['mes_numero'].values[0]
-        if mes_num_inicio <= mes_num_fin:
-            filtro = filtro[(filtro['mes_numero'] >= mes_num_inicio) & (filtro['mes_numero'] <= mes_num_fin)]
-        if cursos:
-            filtro = filtro[filtro['producto'].isin(cursos)]
-        if modalidades:
-            filtro = filtro[filtro['modalidad'].isin(modalidades)]
-        if afiliaciones:
-            filtro = filtro[filtro['tipo_de_afiliacion'].isin(afiliaciones)]
-        if estados:
-            filtro = filtro[filtro['estado'].isin(estados)]
+        selecciones = {
+            'año': años_seleccionados,
+            'producto': cursos,
+            'modalidad': modalidades,
+            'tipo_de_afiliacion': afiliaciones,
+            'estado': estados,
+        }
+        cubo_filtrado = filtrar(cubo, selecciones, (mes_num_inicio, mes_num_fin))
+        totales = resumen(cubo_filtrado)
 
         col1, col2, col3 = st.columns(3)
-        col1.metric("Pedidos", len(filtro))
-        col2.metric("Total recaudado", f"$ {filtro['total'].sum():,.2f}")
-        col3.metric("Cursos únicos", filtro['producto'].nunique())
+        col1.metric("Pedidos", totales['pedidos'])
+        col2.metric("Total recaudado", f"$ {totales['total']:,.2f}")
+        col3.metric("Cursos únicos", totales['productos'])
 
-        st.subheader("🧑‍🎓 Inscritos por curso")
-        cursos_plot = filtro['producto'].value_counts().reset_index()
-        cursos_plot.columns = ['Curso', 'Cantidad']
-        st.plotly_chart(px.bar(cursos_plot, x='Curso', y='Cantidad', title="Inscritos por curso"))
+        # Construcción de los gráficos a partir del cubo filtrado
+        with medir("graficos_pedidos"):
+            st.subheader("🧑‍🎓 Inscritos por curso")
+            cursos_plot = por_dimension(cubo_filtrado, 'producto', ['Curso', 'Cantidad'])
+            st.plotly_chart(px.bar(cursos_plot, x='Curso', y='Cantidad', title="Inscritos por curso"))
 
-        st.subheader("📅 Pedidos por fecha")
-        fecha_plot = filtro.groupby('fecha_pedido').size().reset_index(name='Cantidad')
-        st.plotly_chart(px.line(fecha_plot, x='fecha_pedido', y='Cantidad', title="Pedidos por fecha"))
+            st.subheader("📅 Pedidos por fecha")
+            fecha_plot, agrupacion = preparar_serie(por_fecha(cubo_filtrado), 'fecha_pedido', 'Cantidad')
+            titulo_fecha = f"Pedidos por fecha (por {agrupacion})" if agrupacion else "Pedidos por fecha"
+            st.plotly_chart(px.line(fecha_plot, x='fecha_pedido', y='Cantidad', title=titulo_fecha))
 
-        st.subheader("🧮 Inscritos por modalidad y afiliación")
-        col4, col5 = st.columns(2)
-        modalidad_plot = filtro['modalidad'].value_counts().reset_index()
-        modalidad_plot.columns = ['Modalidad', 'Cantidad']
-        col4.plotly_chart(px.pie(modalidad_plot, names='Modalidad', values='Cantidad', title="Por modalidad"))
+            st.subheader("🧮 Inscritos por modalidad y afiliación")
+            col4, col5 = st.columns(2)
+            modalidad_plot = por_dimension(cubo_filtrado, 'modalidad', ['Modalidad', 'Cantidad'])
+            col4.plotly_chart(px.pie(modalidad_plot, names='Modalidad', values='Cantidad', title="Por modalidad"))
 
-        afiliacion_plot = filtro['tipo_de_afiliacion'].value_counts().reset_index()
-        afiliacion_plot.columns = ['Afiliación', 'Cantidad']
-        col5.plotly_chart(px.pie(afiliacion_plot, names='Afiliación', values='Cantidad', title="Por tipo de afiliación"))
+            afiliacion_plot = por_dimension(cubo_filtrado, 'tipo_de_afiliacion', ['Afiliación', 'Cantidad'])
+            col5.plotly_chart(px.pie(afiliacion_plot, names='Afiliación', values='Cantidad', title="Por tipo de afiliación"))
 
         st.subheader("📋 Detalle de pedidos")
-        st.dataframe(filtro.sort_values(by='fecha_pedido', ascending=False))
+        rango_meses = (mes_num_inicio, mes_num_fin)
+        if st.checkbox("Mostrar detalle de pedidos", value=False):
+            busqueda_pedidos = [col for col in ['producto', 'email', 'nombre'] if col in df.columns]
+            tabla_paginada(
+                df, "tabla_pedidos", columnas_busqueda=busqueda_pedidos,
+                orden_inicial=('fecha_pedido', True), filas=mascara_filtros(df, selecciones, rango_meses)
+            )
 
-        if not filtro.empty:
-            output = io.BytesIO()
-            with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                filtro.to_excel(writer, index=False, sheet_name='Pedidos')
-            output.seek(0)
-            st.download_button(
-                label="📥 Descargar en Excel",
-                data=output,
-                file_name="pedidos_redcoes.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        if totales['pedidos']:
+            boton_exportar(
+                lambda: filtrar(df, selecciones, rango_meses),
+                "pedidos_redcoes", "pedidos", hoja="Pedidos",
+                firma=repr((selecciones, rango_meses, marca))
             )
 
-    with tab3:
+    def seccion_productos():
         df = cargar_productos()
         st.header("📦 Dashboard de Productos REDCOES")
 
@@ -197,17 +200,17 @@ def main():
         if mostrar_unicos:
             filtro = filtro.sort_values(by='id', ascending=False).drop_duplicates(subset='nombre')
 
-        st.dataframe(filtro.sort_values(by='id', ascending=False))
+        tabla_paginada(df, "tabla_productos", columnas_busqueda=['nombre'], orden_inicial=('id', True),
+                       filas=df.index.isin(filtro.index))
 
         if not filtro.empty:
             st.subheader("📈 Precio regular por variación")
             st.plotly_chart(px.bar(filtro, x='nombre', y='precio_regular', color='modalidad', barmode='group', title="Precios por variación"))
 
-            conteo_estados = filtro['estado'].value_counts().reset_index()
-            conteo_estados.columns = ['Estado', 'Cantidad']
+            conteo_estados = conteo(filtro['estado'], ['Estado', 'Cantidad'])
             st.plotly_chart(px.pie(conteo_estados, names='Estado', values='Cantidad', title="Distribución por estado"))
 
-    with tab4:
+    def seccion_miembros():
         df = cargar_miembros()
         st.header("👥 Dashboard de Participantes REDCOES")
 
@@ -238,17 +241,31 @@ def main():
         col2.metric("Correos únicos", filtro['email'].nunique())
 
         if not filtro.empty:
-            conteo_niveles = filtro['membership_level'].value_counts().reset_index()
-            conteo_niveles.columns = ['Nivel', 'Cantidad']
+            conteo_niveles = conteo(filtro['membership_level'], ['Nivel', 'Cantidad'])
             st.plotly_chart(px.pie(conteo_niveles, names='Nivel', values='Cantidad', title="Distribución por nivel de membresía"))
 
-            conteo_estado = filtro['account_state'].value_counts().reset_index()
-            conteo_estado.columns = ['Estado', 'Cantidad']
+            conteo_estado = conteo(filtro['account_state'], ['Estado', 'Cantidad'])
             st.plotly_chart(px.pie(conteo_estado, names='Estado', values='Cantidad', title="Estado de la cuenta"))
 
         st.subheader("📋 Detalle de miembros")
-        st.dataframe(filtro.sort_values(by='subscription_starts', ascending=False))
+        tabla_paginada(df, "tabla_miembros", columnas_busqueda=['email'], orden_inicial=('subscription_starts', True),
+                       filas=df.index.isin(filtro.index))
+
+    secciones = {
+        "🚀 Pedidos de Hoy": seccion_pedidos_hoy,
+        "📊 Pedidos": seccion_pedidos,
+        "📦 Productos": seccion_productos,
+        "👥 Miembros": seccion_miembros,
+    }
+    seccion = st.radio("Sección", list(secciones), horizontal=True, key="seccion_wordpress", label_visibility="collapsed")
+    with pestana(seccion):
+        secciones[seccion]()
+
+    mostrar_estado(DATASETS)
 
 if __name__ == "__main__":
+    iniciar_rerun("WordPress")
     main()
     st.session_state["refrescar"] = False
+    terminar_rerun()
+    mostrar_panel()